@@ -0,0 +1,120 @@
+# Activity log (logins, joins, new classes and assignments, appearance changes).
+#
+# record() only appends to an in-process list. The list is written with one
+# bulk_create once it holds ACTIVITY_BUFFER_SIZE events, once the oldest has
+# waited ACTIVITY_FLUSH_SECONDS (checked on record() and after every
+# request), and when a gunicorn worker shuts down (worker_exit in
+# gunicorn.conf.py). So a busy worker does one INSERT per hundred events
+# instead of one write per view, which is what matters on SQLite.
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import tenancy
+from .models import ActivityEvent
+
+
+logger = logging.getLogger(__name__)
+
+PRUNE_BATCH_SIZE = 5000
+
+_lock = threading.Lock()
+_buffer = []
+_state = {"oldest": None}
+
+
+def _reset():
+    with _lock:
+        _buffer.clear()
+        _state["oldest"] = None
+
+
+# anything the master had buffered is the master's to write
+os.register_at_fork(after_in_child=_reset)
+
+
+def record(action, request=None, user=None, classroom=None, detail=""):
+    if user is None and request is not None:
+        user = getattr(request, "user", None)
+        if user is not None and not user.is_authenticated:
+            user = None
+
+    # the school has to be taken now, the flush may run under another one (or none)
+    event = ActivityEvent(
+        school_id=tenancy.current_school_id(),
+        action=action,
+        user_id=user.id if user else None,
+        classroom_id=classroom.id if classroom else None,
+        detail=detail[:255],
+        ip=request.META.get("REMOTE_ADDR") if request is not None else None,
+        created_at=timezone.now(),
+    )
+    with _lock:
+        _buffer.append(event)
+        if _state["oldest"] is None:
+            _state["oldest"] = time.monotonic()
+    maybe_flush()
+
+
+def _due():
+    return len(_buffer) >= settings.ACTIVITY_BUFFER_SIZE or (
+        _state["oldest"] is not None and time.monotonic() - _state["oldest"] >= settings.ACTIVITY_FLUSH_SECONDS
+    )
+
+
+def maybe_flush():
+    if _due():
+        flush()
+
+
+def flush():
+    """Write everything buffered in this process. Returns how many events."""
+    with _lock:
+        events = _buffer[:]
+        _buffer.clear()
+        _state["oldest"] = None
+    if not events:
+        return 0
+
+    try:
+        ActivityEvent.objects.bulk_create(events, batch_size=500)
+    except Exception:
+        # the log must never break the request that happened to trigger a flush
+        logger.exception("Dropped %d activity events", len(events))
+        return 0
+    return len(events)
+
+
+
+def events_for(user_id=None, classroom_id=None, before=None, limit=50):
+    """Newest first, keyset-paginated on id. Returns (events, next cursor)."""
+    events = ActivityEvent.objects.all()
+    if user_id is not None:
+        events = events.filter(user_id=user_id)
+    if classroom_id is not None:
+        events = events.filter(classroom_id=classroom_id)
+    if before is not None:
+        events = events.filter(id__lt=before)
+
+    rows = list(events.select_related("user", "classroom").order_by("-id")[:limit + 1])
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+def prune(days, batch_size=PRUNE_BATCH_SIZE):
+    """Delete events older than `days`, a batch per statement. Returns how many."""
+    cutoff = timezone.now() - timedelta(days=days)
+    old = ActivityEvent.objects.filter(created_at__lt=cutoff)
+
+    deleted = 0
+    while True:
+        ids = list(old.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ActivityEvent.objects.filter(id__in=ids).delete()[0]
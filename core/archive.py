@@ -0,0 +1,125 @@
+# Moving old assignments out of the hot table (manage.py archive).
+#
+# An assignment goes to ArchivedAssignment together with its submissions
+# (the rows; files stay where they are on disk) and grades, and the students'
+# averages are recomputed without them. Reminder logs and unfinished
+# uploads are dropped. Each batch is one transaction: copy with bulk_create,
+# delete the originals. Archived rows keep their ids, so restore() can put
+# an assignment back exactly as it was.
+import os
+
+from django.db import router, transaction
+
+from . import grades, ical, search
+from .models import (
+    ArchivedAssignment, ArchivedGrade, ArchivedSubmission, Assignment, AssignmentStats, Enrollment, Grade,
+    ReminderLog, Submission, SubmissionUpload,
+)
+
+
+BATCH_SIZE = 500
+
+ASSIGNMENT_FIELDS = ("id", "classroom_id", "title", "description", "due_date", "created_at", "max_upload_mb")
+SUBMISSION_FIELDS = ("id", "assignment_id", "student_id", "file", "original_name", "size", "submitted_at")
+
+
+def archivable(before, classroom_ids=None):
+    # no due date means "still open", those never get archived
+    assignments = Assignment.objects.filter(due_date__lt=before)
+    if classroom_ids:
+        assignments = assignments.filter(classroom_id__in=classroom_ids)
+    return assignments
+
+
+def _archive_batch(ids):
+    assignments = list(Assignment.objects.filter(id__in=ids).values(*ASSIGNMENT_FIELDS))
+    ArchivedAssignment.objects.bulk_create(ArchivedAssignment(**row) for row in assignments)
+    submissions = [
+        ArchivedSubmission(**row)
+        for row in Submission.objects.filter(assignment_id__in=ids).values(*SUBMISSION_FIELDS)
+    ]
+    ArchivedSubmission.objects.bulk_create(submissions, batch_size=BATCH_SIZE)
+    rows = list(
+        Grade.objects.filter(assignment_id__in=ids)
+        .values("id", "assignment_id", "enrollment_id", "enrollment__student_id", "score", "graded_at")
+    )
+    ArchivedGrade.objects.bulk_create(
+        [
+            ArchivedGrade(
+                id=row["id"], assignment_id=row["assignment_id"], student_id=row["enrollment__student_id"],
+                score=row["score"], graded_at=row["graded_at"],
+            )
+            for row in rows
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    search.index_archived(ids)
+
+    partials = [upload.partial_path for upload in SubmissionUpload.objects.filter(assignment_id__in=ids)]
+    # One DELETE per table. A plain .delete() of the assignments would run
+    # the post_delete receivers (search, calendars) for every single row.
+    for model in (Submission, SubmissionUpload, ReminderLog, Grade, AssignmentStats):
+        model.objects.filter(assignment_id__in=ids).delete()
+    Assignment.objects.filter(id__in=ids)._raw_delete(router.db_for_write(Assignment))
+    search.remove_documents(search.KIND_ASSIGNMENT, ids)
+    ical.invalidate_many({row["classroom_id"] for row in assignments})
+    grades.refresh_enrollments(list({row["enrollment_id"] for row in rows}))
+    return len(submissions), partials
+
+
+def archive(before, classroom_ids=None, batch_size=BATCH_SIZE, dry_run=False):
+    """Archive assignments due before `before`. Returns (assignments, submissions)."""
+    assignments = archivable(before, classroom_ids)
+    if dry_run:
+        return assignments.count(), Submission.objects.filter(assignment__in=assignments).count()
+
+    archived_assignments = archived_submissions = 0
+    while True:
+        with transaction.atomic():
+            ids = list(assignments.order_by("id").values_list("id", flat=True)[:batch_size])
+            if not ids:
+                break
+            count, partials = _archive_batch(ids)
+
+        for path in partials:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        archived_assignments += len(ids)
+        archived_submissions += count
+
+    return archived_assignments, archived_submissions
+
+
+@transaction.atomic
+def restore(assignment_id):
+    """Move one archived assignment (and its submissions) back. Returns the Assignment."""
+    archived = ArchivedAssignment.objects.get(id=assignment_id)
+    assignment = Assignment.objects.create(**{field: getattr(archived, field) for field in ASSIGNMENT_FIELDS})
+
+    rows = list(archived.submissions.values(*SUBMISSION_FIELDS))
+    Submission.objects.bulk_create(Submission(**row) for row in rows)
+
+    # auto_now_add stamped both with "now", put the original times back
+    Assignment.objects.filter(id=assignment.id).update(created_at=archived.created_at)
+    for row in rows:
+        Submission.objects.filter(id=row["id"]).update(submitted_at=row["submitted_at"])
+
+    # grades of students who are still in the class
+    enrollments = dict(
+        Enrollment.objects.filter(classroom_id=archived.classroom_id).values_list("student_id", "id")
+    )
+    old_grades = [grade for grade in archived.grades.all() if grade.student_id in enrollments]
+    Grade.objects.bulk_create(
+        Grade(id=grade.id, assignment=assignment, enrollment_id=enrollments[grade.student_id], score=grade.score)
+        for grade in old_grades
+    )
+    for grade in old_grades:
+        Grade.objects.filter(id=grade.id).update(graded_at=grade.graded_at)
+    grades.refresh_assignments([assignment.id])
+    grades.refresh_enrollments([enrollments[grade.student_id] for grade in old_grades])
+
+    archived.delete()
+    assignment.refresh_from_db()
+    return assignment
@@ -0,0 +1,138 @@
+# End-of-term exports: classrooms, rosters and assignments as CSV, or all of
+# it plus banner images in one ZIP.
+#
+# Everything here is a generator. Rows come out of the database through
+# .iterator(chunk_size=...) as plain tuples, go through csv.writer and get
+# yielded in ~64 KB pieces, so memory stays the same for one class or a
+# whole school. The ZIP is written to a sink that gets drained after every
+# write (zipfile handles non-seekable output with data descriptors).
+import csv
+import io
+import os
+import zipfile
+
+from .models import Assignment, Classroom, Enrollment
+
+
+CHUNK_SIZE = 2000
+FLUSH_SIZE = 64 * 1024
+
+
+def classroom_rows(classrooms):
+    yield ("classroom_id", "name", "description", "code", "teacher", "teacher_email")
+    yield from (
+        classrooms
+        .order_by("id")
+        .values_list("id", "name", "description", "code", "teacher__username", "teacher__email")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def roster_rows(classrooms):
+    yield ("classroom_id", "classroom", "username", "email", "first_name", "last_name")
+    yield from (
+        Enrollment.objects
+        .filter(classroom__in=classrooms.values("id"))
+        .order_by("classroom_id", "id")
+        .values_list(
+            "classroom_id", "classroom__name", "student__username",
+            "student__email", "student__first_name", "student__last_name",
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def assignment_rows(classrooms):
+    yield ("classroom_id", "classroom", "assignment_id", "title", "description", "due_date", "created_at")
+    yield from (
+        Assignment.objects
+        .filter(classroom__in=classrooms.values("id"))
+        .order_by("classroom_id", "id")
+        .values_list("classroom_id", "classroom__name", "id", "title", "description", "due_date", "created_at")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_csv(rows):
+    for chunk in csv_chunks(rows):
+        yield chunk.encode("utf-8")
+
+
+class _Sink:
+    """Write-only file object for ZipFile. Whatever was written gets handed out by drain()."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        parts, self.parts = self.parts, []
+        return parts
+
+
+CSV_FILES = (
+    ("classrooms.csv", classroom_rows),
+    ("roster.csv", roster_rows),
+    ("assignments.csv", assignment_rows),
+)
+
+
+def stream_zip(classrooms, include_banners=True):
+    sink = _Sink()
+
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, rows in CSV_FILES:
+            with archive.open(name, "w", force_zip64=True) as entry:
+                for chunk in csv_chunks(rows(classrooms)):
+                    entry.write(chunk.encode("utf-8"))
+                    yield from sink.drain()
+            yield from sink.drain()
+
+        if include_banners:
+            yield from _write_banners(archive, sink, classrooms)
+
+    yield from sink.drain()
+
+
+def _write_banners(archive, sink, classrooms):
+    storage = Classroom._meta.get_field("banner_image").storage
+    banners = (
+        classrooms
+        .exclude(banner_image="")
+        .exclude(banner_image__isnull=True)
+        .order_by("id")
+        .values_list("id", "banner_image")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    for classroom_id, name in banners:
+        if not storage.exists(name):
+            continue
+
+        # images are already compressed, deflating them again is wasted CPU
+        info = zipfile.ZipInfo(f"banners/{classroom_id}{os.path.splitext(name)[1]}")
+        info.compress_type = zipfile.ZIP_STORED
+        with storage.open(name, "rb") as source, archive.open(info, "w", force_zip64=True) as entry:
+            for chunk in source.chunks(FLUSH_SIZE):
+                entry.write(chunk)
+                yield from sink.drain()
+        yield from sink.drain()
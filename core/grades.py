@@ -0,0 +1,188 @@
+# Grades and the summary tables behind the gradebook.
+#
+# Writes go through set_grades(): it upserts the grades, then rewrites the
+# AssignmentStats row of the assignment (one pass over that assignment's
+# grades, a class's worth) and the EnrollmentStats rows of the students
+# involved (one grouped query). The gradebook itself only reads summary rows,
+# so it costs the same with 20 grades or 20,000.
+# Enrollments are deleted through remove_enrollments() (Enrollment.delete()
+# goes there too), which refreshes the stats of every assignment involved at
+# once, after the commit. `manage.py check_grade_stats` compares the summary
+# rows with the grades, in case something deleted them behind its back.
+import statistics
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from .models import Assignment, AssignmentStats, Enrollment, EnrollmentStats, Grade
+
+
+MAX_SCORE = Decimal(100)
+CHECK_BATCH_SIZE = 500
+
+
+class InvalidScore(Exception):
+    pass
+
+
+def parse_score(text):
+    """Decimal score from form input, None for an empty box."""
+    text = (text or "").strip()
+    if not text:
+        return None
+    try:
+        score = Decimal(text)
+    except InvalidOperation:
+        raise InvalidScore
+    if not score.is_finite() or not 0 <= score <= MAX_SCORE:
+        raise InvalidScore
+    return score.quantize(Decimal("0.01"))
+
+
+def summarize(scores):
+    buckets = AssignmentStats.HISTOGRAM_BUCKETS
+    histogram = [0] * buckets
+    for score in scores:
+        # 100 goes in the top bucket with the 90s
+        histogram[min(int(score * buckets // 100), buckets - 1)] += 1
+    return {
+        "count": len(scores),
+        "mean": statistics.fmean(scores) if scores else None,
+        "median": statistics.median(scores) if scores else None,
+        "histogram": histogram,
+    }
+
+
+def refresh_assignments(assignment_ids):
+    # skip anything deleted in the meantime, a stats row would point nowhere
+    assignment_ids = list(Assignment.objects.filter(id__in=assignment_ids).values_list("id", flat=True))
+    if not assignment_ids:
+        return
+
+    scores = _scores(assignment_ids)
+    AssignmentStats.objects.bulk_create(
+        [AssignmentStats(assignment_id=assignment_id, **summarize(values)) for assignment_id, values in scores.items()],
+        update_conflicts=True,
+        unique_fields=["assignment"],
+        update_fields=["count", "mean", "median", "histogram", "updated_at"],
+    )
+
+
+def _scores(assignment_ids):
+    scores = {assignment_id: [] for assignment_id in assignment_ids}
+    for assignment_id, score in Grade.objects.filter(assignment_id__in=assignment_ids).values_list("assignment_id", "score"):
+        scores[assignment_id].append(float(score))
+    return scores
+
+
+def _totals(enrollment_ids):
+    # enrollment id -> (count, average)
+    totals = {
+        row["enrollment_id"]: (row["count"], float(row["average"]))
+        for row in (
+            Grade.objects
+            .filter(enrollment_id__in=enrollment_ids)
+            .values("enrollment_id")
+            .annotate(count=Count("id"), average=Avg("score"))
+            .order_by()
+        )
+    }
+    return {enrollment_id: totals.get(enrollment_id, (0, None)) for enrollment_id in enrollment_ids}
+
+
+def refresh_enrollments(enrollment_ids):
+    stats = [
+        EnrollmentStats(enrollment_id=enrollment_id, count=count, average=average)
+        for enrollment_id, (count, average) in _totals(enrollment_ids).items()
+    ]
+    EnrollmentStats.objects.bulk_create(
+        stats,
+        update_conflicts=True,
+        unique_fields=["enrollment"],
+        update_fields=["count", "average", "updated_at"],
+    )
+
+
+@transaction.atomic
+def set_grades(assignment, scores):
+    """Save {enrollment_id: score or None} for one assignment. None clears the grade."""
+    graded = [
+        Grade(assignment=assignment, enrollment_id=enrollment_id, score=score)
+        for enrollment_id, score in scores.items() if score is not None
+    ]
+    cleared = [enrollment_id for enrollment_id, score in scores.items() if score is None]
+
+    Grade.objects.bulk_create(
+        graded,
+        update_conflicts=True,
+        unique_fields=["assignment", "enrollment"],
+        update_fields=["score", "graded_at"],
+    )
+    if cleared:
+        Grade.objects.filter(assignment=assignment, enrollment_id__in=cleared).delete()
+
+    refresh_assignments([assignment.id])
+    refresh_enrollments(list(scores))
+
+
+def assignments_graded_for(enrollments):
+    """Ids of the assignments with a grade from any of `enrollments` (a queryset)."""
+    return list(Grade.objects.filter(enrollment__in=enrollments).values_list("assignment_id", flat=True).distinct())
+
+
+def refresh_after_commit(assignment_ids):
+    # Once the grades are really gone. If the whole class went, so did its
+    # assignments, and refresh_assignments() skips them.
+    if assignment_ids:
+        transaction.on_commit(lambda: refresh_assignments(assignment_ids))
+
+
+@transaction.atomic
+def remove_enrollments(enrollments):
+    """Delete enrollments (a queryset) with their grades, and refresh the stats of what they were graded on."""
+    assignment_ids = assignments_graded_for(enrollments)
+    deleted = enrollments.delete()
+    refresh_after_commit(assignment_ids)
+    return deleted
+
+
+def stale_stats(batch_size=CHECK_BATCH_SIZE):
+    """(assignment ids, enrollment ids) whose summary rows don't match their grades."""
+    stale_assignments = []
+    assignment_ids = list(Assignment.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(assignment_ids), batch_size):
+        batch = assignment_ids[start:start + batch_size]
+        stored = AssignmentStats.objects.in_bulk(batch)
+        for assignment_id, scores in _scores(batch).items():
+            expected = summarize(scores)
+            row = stored.get(assignment_id)
+            # no row yet is fine for an assignment nobody has graded
+            if row is None:
+                if scores:
+                    stale_assignments.append(assignment_id)
+            elif {key: getattr(row, key) for key in expected} != expected:
+                stale_assignments.append(assignment_id)
+
+    stale_enrollments = []
+    enrollment_ids = list(Enrollment.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(enrollment_ids), batch_size):
+        batch = enrollment_ids[start:start + batch_size]
+        stored = EnrollmentStats.objects.in_bulk(batch)
+        for enrollment_id, (count, average) in _totals(batch).items():
+            row = stored.get(enrollment_id)
+            if row is None:
+                if count:
+                    stale_enrollments.append(enrollment_id)
+            elif (row.count, row.average) != (count, average):
+                stale_enrollments.append(enrollment_id)
+
+    return stale_assignments, stale_enrollments
+
+
+def class_average(stats):
+    """Average over every grade in the class, from its AssignmentStats rows."""
+    count = sum(s.count for s in stats)
+    if not count:
+        return None
+    return sum(s.mean * s.count for s in stats if s.count) / count
@@ -0,0 +1,128 @@
+# iCalendar (.ics) feeds for assignment due dates.
+#
+# Each classroom's events are rendered once and stored in ClassroomCalendar.
+# Saving/deleting an assignment just throws that row away (see signals.py) and
+# the next poll rebuilds it, so a burst of edits costs a single rebuild.
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import Assignment, ClassroomCalendar
+
+
+PRODID = "-//SchoolHub//Assignments//EN"
+
+
+def escape_text(value):
+    # RFC 5545 3.3.11
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold_line(line):
+    # Lines longer than 75 octets get split, continuation lines start with a space
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # don't cut a multi-byte character in half
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+        limit = 74
+    return "\r\n ".join(parts)
+
+
+def render_events(classroom, assignments):
+    lines = []
+    for assignment in assignments:
+        stamp = (assignment.created_at or timezone.now()).astimezone(dt_timezone.utc)
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:assignment-{assignment.id}@schoolhub",
+            f"DTSTAMP:{stamp:%Y%m%dT%H%M%SZ}",
+            f"DTSTART;VALUE=DATE:{assignment.due_date:%Y%m%d}",
+            f"DTEND;VALUE=DATE:{assignment.due_date + timedelta(days=1):%Y%m%d}",
+            "SUMMARY:" + escape_text(f"{assignment.title} ({classroom.name})"),
+        ]
+        if assignment.description:
+            lines.append("DESCRIPTION:" + escape_text(assignment.description))
+        lines.append("END:VEVENT")
+
+    return "".join(fold_line(line) + "\r\n" for line in lines)
+
+
+def build_classroom_calendar(classroom):
+    assignments = (
+        Assignment.objects.filter(classroom=classroom, due_date__isnull=False)
+        .only("id", "title", "description", "due_date", "created_at")
+        .order_by("due_date", "id")
+    )
+    events = render_events(classroom, assignments)
+
+    calendar, _ = ClassroomCalendar.objects.update_or_create(
+        classroom=classroom,
+        defaults={
+            "events": events,
+            "etag": hashlib.sha256(events.encode("utf-8")).hexdigest()[:32],
+            "updated_at": timezone.now(),
+        },
+    )
+    return calendar
+
+
+def get_calendars(classrooms):
+    """Stored calendars for the given classrooms, rebuilding any that are missing."""
+    classrooms = list(classrooms)
+    stored = {
+        c.classroom_id: c
+        for c in ClassroomCalendar.objects.filter(classroom__in=classrooms)
+    }
+    return [stored.get(c.id) or build_classroom_calendar(c) for c in classrooms]
+
+
+def invalidate(classroom_id):
+    ClassroomCalendar.objects.filter(classroom_id=classroom_id).delete()
+
+
+def invalidate_many(classroom_ids):
+    ClassroomCalendar.objects.filter(classroom_id__in=classroom_ids).delete()
+
+
+def feed_etag(calendars):
+    if len(calendars) == 1:
+        return calendars[0].etag
+    joined = ",".join(c.etag for c in calendars)
+    return hashlib.sha256(joined.encode("ascii")).hexdigest()[:32]
+
+
+def feed_last_modified(calendars):
+    return max((c.updated_at for c in calendars), default=None)
+
+
+def render_feed(name, calendars):
+    header = "".join(fold_line(line) + "\r\n" for line in [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:" + escape_text(name),
+    ])
+    return header + "".join(c.events for c in calendars) + "END:VCALENDAR\r\n"
+
+
+def classrooms_for(user):
+    # stable order so the combined etag doesn't flip between polls
+    return user.visible_classrooms().order_by("id")
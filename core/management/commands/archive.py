@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import archive
+from core.models import ArchivedAssignment
+
+
+class Command(BaseCommand):
+    help = (
+        "Move old assignments and their submissions into the archive tables. "
+        "They stay reachable from a class's Past tab and from search."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--before", type=date.fromisoformat,
+                            help="Archive assignments due before this date (YYYY-MM-DD), e.g. the end of a term.")
+        parser.add_argument("--days", type=int,
+                            help="Without --before: archive assignments due more than this many days ago (default 365).")
+        parser.add_argument("--classroom", type=int, action="append",
+                            help="Only this class (repeatable). Without --before/--days everything already past is archived.")
+        parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE,
+                            help=f"Assignments per transaction (default {archive.BATCH_SIZE}).")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only count what would be archived.")
+        parser.add_argument("--restore", type=int, metavar="ASSIGNMENT_ID",
+                            help="Move this archived assignment back instead.")
+
+    def handle(self, *args, **options):
+        if options["restore"]:
+            try:
+                assignment = archive.restore(options["restore"])
+            except ArchivedAssignment.DoesNotExist:
+                raise CommandError(f"No archived assignment {options['restore']}.")
+            self.stdout.write(f"Restored {assignment.title!r}.")
+            return
+
+        today = timezone.localdate()
+        if options["before"]:
+            before = min(options["before"], today)
+        elif options["days"] is not None:
+            before = today - timedelta(days=options["days"])
+        elif options["classroom"]:
+            before = today
+        else:
+            before = today - timedelta(days=365)
+
+        assignments, submissions = archive.archive(
+            before,
+            classroom_ids=options["classroom"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+
+        verb = "Would archive" if options["dry_run"] else "Archived"
+        self.stdout.write(
+            f"{verb} {assignments} assignment(s) due before {before} with {submissions} submission(s)."
+        )
@@ -0,0 +1,16 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from core.models import gradient_css
+
+
+CSS_PATH = Path(__file__).resolve().parents[2] / "static" / "gradients.css"
+
+
+class Command(BaseCommand):
+    help = "Regenerate core/static/gradients.css from GRADIENT_PAIRS."
+
+    def handle(self, *args, **options):
+        CSS_PATH.write_text(gradient_css())
+        self.stdout.write(self.style.SUCCESS(f"Wrote {CSS_PATH}"))
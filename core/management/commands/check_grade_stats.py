@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import grades
+
+
+class Command(BaseCommand):
+    help = "Compare the gradebook summary tables with the grades, and optionally rebuild what's out of date."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Refresh the stale summary rows.")
+
+    def handle(self, *args, **options):
+        assignment_ids, enrollment_ids = grades.stale_stats()
+        if not assignment_ids and not enrollment_ids:
+            self.stdout.write(self.style.SUCCESS("Grade summaries are up to date."))
+            return
+
+        summary = f"{len(assignment_ids)} assignment(s) and {len(enrollment_ids)} enrollment(s) with stale summaries"
+        if not options["fix"]:
+            raise CommandError(f"{summary}. Run with --fix to rebuild them.")
+
+        with transaction.atomic():
+            grades.refresh_assignments(assignment_ids)
+            grades.refresh_enrollments(enrollment_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {summary}."))
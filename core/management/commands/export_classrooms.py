@@ -0,0 +1,54 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import exports
+from core.models import Classroom, School
+
+
+class Command(BaseCommand):
+    help = "Export classrooms, rosters and assignments (and banner images) without loading them into memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", "-o", default="-",
+                            help="File to write, or - for stdout (default).")
+        parser.add_argument("--format", choices=["zip", "classrooms", "roster", "assignments"], default="zip")
+        parser.add_argument("--school", help="Only this school (slug). Default: every school.")
+        parser.add_argument("--classroom", type=int, action="append", dest="classrooms",
+                            help="Only this classroom id (repeatable). Default: all of them.")
+        parser.add_argument("--no-banners", action="store_true", help="Leave banner images out of the ZIP.")
+
+    def handle(self, *args, **options):
+        classrooms = Classroom.objects.all()
+        if options["school"]:
+            school = School.objects.filter(slug=options["school"]).first()
+            if school is None:
+                raise CommandError(f"No school {options['school']!r}.")
+            classrooms = classrooms.filter(school=school)
+        if options["classrooms"]:
+            classrooms = classrooms.filter(id__in=options["classrooms"])
+            if not classrooms.exists():
+                raise CommandError("No matching classrooms.")
+
+        fmt = options["format"]
+        if fmt == "zip":
+            chunks = exports.stream_zip(classrooms, include_banners=not options["no_banners"])
+        else:
+            rows = {
+                "classrooms": exports.classroom_rows,
+                "roster": exports.roster_rows,
+                "assignments": exports.assignment_rows,
+            }[fmt]
+            chunks = exports.stream_csv(rows(classrooms))
+
+        if options["output"] == "-":
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+            return
+
+        with open(options["output"], "wb") as out:
+            for chunk in chunks:
+                out.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
@@ -0,0 +1,120 @@
+import gzip
+import re
+from pathlib import Path
+
+import brotli
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from core.models import Classroom, User
+
+
+ASSET_RE = re.compile(
+    r'<(?:link[^>]+rel="stylesheet"[^>]+href|script[^>]+src|img[^>]+src)="([^"]+)"'
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measure how many requests and bytes a cold (empty browser cache) dashboard load costs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", help="Render the dashboard as this existing user.")
+        parser.add_argument("--classes", type=int, default=6,
+                            help="Classes to create for the throwaway user (default 6).")
+        parser.add_argument("--max-bytes", type=int,
+                            help="Fail if the compressed total goes over this many bytes.")
+        parser.add_argument("--max-requests", type=int,
+                            help="Fail if the page needs more requests than this.")
+
+    def handle(self, *args, **options):
+        html = self.render_dashboard(options["username"], options["classes"])
+
+        rows = [("dashboard HTML", *self.sizes(html))]
+        for url in ASSET_RE.findall(html.decode("utf-8")):
+            rows.append((url, *self.asset_sizes(url)))
+
+        self.stdout.write(f"{'resource':<60} {'raw':>10} {'gzip':>10} {'brotli':>10}")
+        for name, raw, gz, br in rows:
+            self.stdout.write(f"{name[:60]:<60} {self.fmt(raw)} {self.fmt(gz)} {self.fmt(br)}")
+
+        raw_total = sum(r[1] or 0 for r in rows)
+        wire_total = sum(min([x for x in r[1:] if x is not None], default=0) for r in rows)
+        external = [r[0] for r in rows if r[1] is None]
+
+        self.stdout.write("")
+        self.stdout.write(f"requests: {len(rows)}")
+        self.stdout.write(f"bytes (uncompressed): {raw_total}")
+        self.stdout.write(f"bytes (best encoding): {wire_total}")
+        if external:
+            self.stdout.write(self.style.WARNING(f"not measured (external): {', '.join(external)}"))
+
+        if options["max_requests"] is not None and len(rows) > options["max_requests"]:
+            raise CommandError(f"{len(rows)} requests is over the budget of {options['max_requests']}.")
+        if options["max_bytes"] is not None and wire_total > options["max_bytes"]:
+            raise CommandError(f"{wire_total} bytes is over the budget of {options['max_bytes']}.")
+
+    def render_dashboard(self, username, classes):
+        client = Client()
+
+        if username:
+            try:
+                client.force_login(User.objects.get(username=username))
+            except User.DoesNotExist:
+                raise CommandError(f"No user called {username!r}.")
+            return self.get_dashboard(client)
+
+        # Throwaway teacher with a few classes, rolled back afterwards
+        html = None
+        try:
+            with transaction.atomic():
+                teacher = User.objects.create_user(username="__page_weight__", is_teacher=True)
+                for i in range(classes):
+                    Classroom.objects.create(name=f"Class {i + 1}", teacher=teacher)
+                client.force_login(teacher)
+                html = self.get_dashboard(client)
+                raise Rollback
+        except Rollback:
+            pass
+        return html
+
+    def get_dashboard(self, client):
+        response = client.get(reverse("dashboard"))
+        if response.status_code != 200:
+            raise CommandError(f"Dashboard returned {response.status_code}.")
+        return response.content
+
+    def sizes(self, data):
+        return len(data), len(gzip.compress(data, 9)), len(brotli.compress(data))
+
+    def asset_sizes(self, url):
+        if not url.startswith(settings.STATIC_URL):
+            return None, None, None
+
+        name = url[len(settings.STATIC_URL):].split("?")[0]
+
+        # Prefer what collectstatic produced, since that's what gets served
+        collected = Path(settings.STATIC_ROOT) / name
+        if collected.exists():
+            gz = collected.with_name(collected.name + ".gz")
+            br = collected.with_name(collected.name + ".br")
+            return (
+                collected.stat().st_size,
+                gz.stat().st_size if gz.exists() else None,
+                br.stat().st_size if br.exists() else None,
+            )
+
+        path = finders.find(name)
+        if path is None:
+            raise CommandError(f"Can't find static file {name}.")
+        return self.sizes(Path(path).read_bytes())
+
+    def fmt(self, value):
+        return f"{'-' if value is None else value:>10}"
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import activity
+
+
+class Command(BaseCommand):
+    help = "Delete activity log entries older than the retention period."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.ACTIVITY_RETENTION_DAYS,
+                            help=f"Keep this many days of activity (default {settings.ACTIVITY_RETENTION_DAYS}).")
+        parser.add_argument("--batch-size", type=int, default=activity.PRUNE_BATCH_SIZE,
+                            help=f"Rows per DELETE (default {activity.PRUNE_BATCH_SIZE}).")
+
+    def handle(self, *args, **options):
+        deleted = activity.prune(options["days"], options["batch_size"])
+        self.stdout.write(f"Removed {deleted} activity event(s).")
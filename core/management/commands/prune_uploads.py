@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import SubmissionUpload
+from core.submissions import discard_upload
+
+
+class Command(BaseCommand):
+    help = "Delete resumable submission uploads that haven't received a chunk in a while."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=48,
+                            help="Drop uploads idle for longer than this (default 48).")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options["hours"])
+        stale = SubmissionUpload.objects.filter(updated_at__lt=cutoff)
+
+        count = 0
+        for upload in stale.iterator():
+            discard_upload(upload)
+            count += 1
+
+        self.stdout.write(f"Removed {count} abandoned upload(s).")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from the assignment and classroom tables."
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            self.stdout.write(f"Nothing to rebuild on {connection.vendor}, the database maintains its own index.")
+            return
+
+        with transaction.atomic():
+            search.rebuild()
+
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core.reminders import send_reminders
+
+
+class Command(BaseCommand):
+    help = "Email each student one digest of the assignments due soon. Safe to run repeatedly (e.g. hourly from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=1,
+                            help="Include assignments due from today up to this many days ahead (default 1).")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Students per query/SMTP batch (default 1000).")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Work out who would get what, but send and record nothing.")
+
+    def handle(self, *args, **options):
+        emails, reminders = send_reminders(
+            days=options["days"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+
+        verb = "Would send" if options["dry_run"] else "Sent"
+        self.stdout.write(f"{verb} {emails} digest(s) covering {reminders} reminder(s).")
@@ -0,0 +1,179 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter (with -X importtime) so nothing this process
+# already imported skews the numbers. Does what a gunicorn worker does before
+# its first request, one phase at a time.
+PROBE = r"""
+import json, os, sys, time
+
+def rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return 0
+
+phases = []
+last = time.perf_counter()
+
+def mark(name):
+    global last
+    now = time.perf_counter()
+    phases.append((name, now - last, rss()))
+    last = now
+
+mark("interpreter")
+
+import django
+mark("import django")
+
+django.setup(set_prefix=False)
+mark("django.setup() (settings, apps, models)")
+
+from schoolhub.wsgi import application
+mark("WSGI handler + middleware")
+
+from django.urls import get_resolver
+get_resolver().url_patterns
+mark("URL conf (views)")
+
+from django.template.loader import get_template
+for name in sys.argv[1:]:
+    get_template(name)
+mark("templates")
+
+print(json.dumps(phases))
+"""
+
+TEMPLATES = ("layout.html", "dashboard.html", "class_detail.html", "inspect_assignment.html")
+
+
+class Command(BaseCommand):
+    help = (
+        "Show where a worker's boot time and memory go: import time per package, "
+        "setup phases, and (with --pid) RSS/PSS of running gunicorn workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=15,
+                            help="How many packages/modules to list (default 15).")
+        parser.add_argument("--pid", type=int,
+                            help="Also report memory of this gunicorn master and its workers.")
+
+    def handle(self, *args, **options):
+        phases, imports = self.probe()
+
+        self.stdout.write(f"{'phase':<42} {'seconds':>9} {'RSS MB':>9}")
+        for name, seconds, rss in phases:
+            self.stdout.write(f"{name:<42} {seconds:>9.3f} {rss / 2**20:>9.1f}")
+        total = sum(seconds for _, seconds, _ in phases)
+        self.stdout.write(f"{'total':<42} {total:>9.3f} {phases[-1][2] / 2**20:>9.1f}")
+
+        self.stdout.write("")
+        self.stdout.write(
+            f"imports: {sum(m[1] for m in imports) / 1e6:.3f} s across {len(imports)} modules"
+        )
+        self.write_packages(imports, options["top"])
+        self.write_modules(imports, options["top"])
+
+        if options["pid"]:
+            self.stdout.write("")
+            self.write_workers(options["pid"])
+
+    def probe(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "schoolhub.settings"))
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE, *TEMPLATES],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Startup probe failed:\n{result.stderr[-2000:]}")
+
+        # "import time:   self [us] | cumulative | imported package"
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            parts = line[len("import time:"):].split("|")
+            if len(parts) != 3 or not parts[0].strip().isdigit():
+                continue
+            imports.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+
+        return json.loads(result.stdout.strip().splitlines()[-1]), imports
+
+    def write_packages(self, imports, top):
+        packages = {}
+        for module, own, _ in imports:
+            name = module.split(".")[0]
+            count, micros = packages.get(name, (0, 0))
+            packages[name] = (count + 1, micros + own)
+
+        self.stdout.write("")
+        self.stdout.write(f"{'package':<42} {'ms':>9} {'modules':>9}")
+        for name, (count, micros) in sorted(packages.items(), key=lambda p: -p[1][1])[:top]:
+            self.stdout.write(f"{name:<42} {micros / 1000:>9.1f} {count:>9}")
+
+    def write_modules(self, imports, top):
+        self.stdout.write("")
+        self.stdout.write(f"{'slowest modules (self)':<42} {'ms':>9} {'cum ms':>9}")
+        for module, own, cumulative in sorted(imports, key=lambda m: -m[1])[:top]:
+            self.stdout.write(f"{module[:42]:<42} {own / 1000:>9.1f} {cumulative / 1000:>9.1f}")
+
+    def write_workers(self, master):
+        if not Path(f"/proc/{master}").exists():
+            raise CommandError(f"No process {master} (this needs Linux /proc).")
+
+        # With preload_app most of a worker's RSS is pages shared with the
+        # master; PSS splits those between the processes, Private is what
+        # each worker really costs.
+        self.stdout.write(f"{'process':<20} {'RSS MB':>9} {'PSS MB':>9} {'Private MB':>11} {'Shared MB':>10}")
+        for label, pid in [("master", master)] + [("worker", pid) for pid in self.children(master)]:
+            mem = self.smaps(pid)
+            private = mem.get("Private_Clean", 0) + mem.get("Private_Dirty", 0)
+            shared = mem.get("Shared_Clean", 0) + mem.get("Shared_Dirty", 0)
+            self.stdout.write(
+                f"{f'{label} {pid}':<20} {mem.get('Rss', 0) / 1024:>9.1f} {mem.get('Pss', 0) / 1024:>9.1f}"
+                f" {private / 1024:>11.1f} {shared / 1024:>10.1f}"
+            )
+
+    def children(self, parent):
+        pids = []
+        for entry in Path("/proc").iterdir():
+            if not entry.name.isdigit():
+                continue
+            try:
+                stat = (entry / "stat").read_text()
+            except OSError:
+                continue
+            # the command name can contain spaces, the fields after it can't
+            if int(stat.rsplit(")", 1)[1].split()[1]) == parent:
+                pids.append(int(entry.name))
+        return sorted(pids)
+
+    def smaps(self, pid):
+        # kB per field, summed over all mappings
+        totals = {}
+        try:
+            lines = Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()
+        except OSError:
+            return totals
+        for line in lines:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                totals[parts[0].rstrip(":")] = int(parts[1])
+        return totals
@@ -0,0 +1,154 @@
+# Sending files off disk: uploaded media, and anything else that needs the
+# same treatment (conditional GET, Range, front-server offload).
+#
+# settings.MEDIA_SERVE_MODE picks how the bytes get out:
+#   "python"            stream from Django in chunks (FileResponse-style)
+#   "x-accel-redirect"  nginx: we answer with a header, nginx sends the file
+#   "x-sendfile"        Apache mod_xsendfile / lighttpd, same idea
+import mimetypes
+import os
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import is_content_addressed
+
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag(name, stat):
+    if is_content_addressed(name):
+        # the name *is* the hash of the contents
+        return quote_etag(Path(name).stem)
+    return quote_etag(f"{int(stat.st_mtime)}-{stat.st_size}")
+
+
+def _parse_range(header, size):
+    """(start, end) inclusive for a single "bytes=" range, None to ignore it, or False if unsatisfiable."""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        # multiple ranges or garbage: just send the whole thing
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        # suffix range, "the last N bytes"
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def send_file(request, root, name, accel_prefix, as_attachment=False, filename=None,
+              content_type=None, private=False):
+    """Respond with root/name honouring conditional and Range requests.
+
+    accel_prefix is the internal nginx location that maps onto root, used in
+    x-accel-redirect mode.
+    """
+    try:
+        path = Path(safe_join(root, name))
+    except SuspiciousFileOperation:
+        raise Http404("File not found.")
+    if not path.is_file():
+        raise Http404("File not found.")
+
+    stat = path.stat()
+    etag = _etag(name, stat)
+    # whole seconds, like If-Modified-Since, or a fractional mtime is never "not modified"
+    last_modified = int(stat.st_mtime)
+
+    if private:
+        cache_control = "private, max-age=0, must-revalidate"
+    elif is_content_addressed(name):
+        cache_control = f"public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        cache_control = f"public, max-age={settings.MEDIA_MAX_AGE}"
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified["Cache-Control"] = cache_control
+        return not_modified
+
+    if content_type is None:
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == "x-accel-redirect":
+        # nginx does Range/conditional itself for internal locations
+        response = HttpResponse(content_type=content_type)
+        # a URI for nginx: older banners can have spaces or non-ASCII names
+        response["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(name.lstrip("/"))
+    elif mode == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = os.fspath(path)
+    else:
+        response = _python_response(request, path, stat.st_size, etag, content_type)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = cache_control
+    response["Accept-Ranges"] = "bytes"
+    if as_attachment or filename:
+        response["Content-Disposition"] = content_disposition_header(as_attachment, filename or path.name)
+    return response
+
+
+def _python_response(request, path, size, etag, content_type):
+    byte_range = None
+    range_header = request.META.get("HTTP_RANGE")
+    if range_header and request.method == "GET":
+        if_range = request.META.get("HTTP_IF_RANGE")
+        # If-Range with a stale validator means "send it all again"
+        if not if_range or if_range == etag:
+            byte_range = _parse_range(range_header, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+        response.block_size = CHUNK_SIZE
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(_read_range(path, start, length), status=206, content_type=content_type)
+    response["Content-Length"] = str(length)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    return send_file(request, settings.MEDIA_ROOT, path, settings.MEDIA_ACCEL_REDIRECT_PREFIX)
@@ -0,0 +1,337 @@
+# Prometheus metrics, served at /metrics.
+#
+# Each process counts into plain dicts behind a lock, which is a fraction of
+# a microsecond per increment. At most every METRICS_FLUSH_SECONDS it writes
+# its totals to its own file in METRICS_DIR (write + rename, so readers never
+# see half a file), and /metrics adds up the files of all gunicorn workers.
+# A process that exits cleanly (worker_exit in gunicorn.conf.py, or atexit)
+# folds its totals into one archive file and removes its own, so counters
+# keep growing when max_requests recycles workers and the directory doesn't
+# fill up. Nothing ever guesses from pids whether a worker is still around
+# (pids get reused, and workers in other containers have their own): a file
+# left by a worker that was killed simply keeps its last totals.
+#
+# Business gauges (classrooms, enrollments, ...) are counted at scrape time,
+# over all schools, and cached for METRICS_GAUGE_SECONDS.
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends import locmem, redis
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import tenancy
+
+try:
+    import fcntl
+except ImportError:  # Windows: fine for a single dev server
+    fcntl = None
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    "schoolhub_http_requests_total": ("counter", "Requests by URL name and status code."),
+    "schoolhub_http_request_duration_seconds": ("histogram", "Time spent in Django per request, by URL name."),
+    "schoolhub_http_request_db_queries_total": ("counter", "Database queries run while handling requests, by URL name."),
+    "schoolhub_db_queries_total": ("counter", "Database queries by connection alias."),
+    "schoolhub_cache_requests_total": ("counter", "Cache lookups by result (hit or miss)."),
+    "schoolhub_cache_hit_ratio": ("gauge", "Cache hits / lookups since the metrics store was created."),
+    "schoolhub_logins_total": ("counter", "Login attempts by result (success or failure)."),
+    "schoolhub_classrooms": ("gauge", "Classrooms."),
+    "schoolhub_enrollments": ("gauge", "Student enrollments."),
+    "schoolhub_users": ("gauge", "Users by role."),
+    "schoolhub_assignments_due_today": ("gauge", "Assignments due today."),
+}
+
+_lock = threading.Lock()
+_file_lock = threading.Lock()  # a flush from another thread can't write the file back after retire()
+_counters = {}    # (name, labels) -> value; labels is a tuple of (key, value) pairs
+_histograms = {}  # (name, labels) -> [count per bucket..., count over the last bucket, sum]
+_state = {"file": None, "flushed": time.monotonic(), "retired": False}
+
+# per-request query counter, set by MetricsMiddleware
+_request_queries = ContextVar("metrics_queries", default=None)
+
+
+def _reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+    _state["file"] = None
+    _state["flushed"] = time.monotonic()
+    _state["retired"] = False
+
+
+# A forked worker starts from zero with a file of its own (the master's
+# numbers, if any, are in the master's file).
+os.register_at_fork(after_in_child=_reset)
+
+
+def inc(name, labels=(), amount=1):
+    key = (name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, labels, value):
+    bucket = bisect_left(LATENCY_BUCKETS, value)
+    key = (name, labels)
+    with _lock:
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+        counts[bucket] += 1
+        counts[-1] += value
+
+
+# Shared store
+
+def _directory():
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def _snapshot():
+    with _lock:
+        return {
+            "counters": [[name, labels, value] for (name, labels), value in _counters.items()],
+            "histograms": [[name, labels, list(counts)] for (name, labels), counts in _histograms.items()],
+        }
+
+
+def _write(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def flush():
+    """Write this process's totals to its file in METRICS_DIR."""
+    _state["flushed"] = time.monotonic()
+    with _file_lock:
+        if _state["retired"]:
+            return
+        if _state["file"] is None:
+            _state["file"] = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+        _write(_directory() / _state["file"], _snapshot())
+
+
+def maybe_flush():
+    if time.monotonic() - _state["flushed"] >= settings.METRICS_FLUSH_SECONDS:
+        flush()
+
+
+@contextmanager
+def _exclusive(directory):
+    with open(directory / "lock", "w") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _load(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {"counters": [], "histograms": []}
+
+
+def _merge(totals, data):
+    counters, histograms = totals
+    for name, labels, value in data["counters"]:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, counts in data["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        if key in histograms:
+            histograms[key] = [a + b for a, b in zip(histograms[key], counts)]
+        else:
+            histograms[key] = list(counts)
+
+
+def _dump(totals):
+    counters, histograms = totals
+    return {
+        "counters": [[n, l, v] for (n, l), v in counters.items()],
+        "histograms": [[n, l, c] for (n, l), c in histograms.items()],
+    }
+
+
+def retire():
+    """Fold this process's totals into the archive and stop writing. For a process that is exiting."""
+    with _file_lock:
+        if _state["retired"]:
+            return
+        _state["retired"] = True
+        if not _counters and not _histograms and _state["file"] is None:
+            return
+
+        directory = _directory()
+        with _exclusive(directory):
+            archive_path = directory / "archive.json"
+            folded = ({}, {})
+            _merge(folded, _load(archive_path))
+            # the snapshot already holds everything the file does
+            _merge(folded, _snapshot())
+            _write(archive_path, _dump(folded))
+            if _state["file"] is not None:
+                (directory / _state["file"]).unlink(missing_ok=True)
+
+
+@atexit.register
+def _retire_at_exit():
+    # only processes that served requests; management commands stay out of it
+    if _histograms:
+        retire()
+
+
+def collect():
+    """Totals over every process that has written to METRICS_DIR: (counters, histograms)."""
+    flush()
+    directory = _directory()
+    totals = ({}, {})
+
+    # under the lock, so a file being folded into the archive is counted once
+    with _exclusive(directory):
+        for path in directory.glob("*-*.json"):
+            _merge(totals, _load(path))
+        _merge(totals, _load(directory / "archive.json"))
+    return totals
+
+
+# Business gauges
+
+def business_gauges():
+    def count():
+        from .models import Assignment, Classroom, Enrollment, User
+
+        users = User.objects.aggregate(
+            teachers=Count("id", filter=Q(is_teacher=True)),
+            students=Count("id", filter=Q(is_teacher=False)),
+        )
+        return [
+            ["schoolhub_classrooms", [], Classroom.objects.count()],
+            ["schoolhub_enrollments", [], Enrollment.objects.count()],
+            ["schoolhub_users", [["role", "teacher"]], users["teachers"]],
+            ["schoolhub_users", [["role", "student"]], users["students"]],
+            ["schoolhub_assignments_due_today", [], Assignment.objects.filter(due_date=timezone.localdate()).count()],
+        ]
+
+    # every school's rows, under one cache key
+    with tenancy.use_school(None):
+        return cache.get_or_set("metrics:gauges", count, settings.METRICS_GAUGE_SECONDS)
+
+
+# Text exposition format
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    counters, histograms = collect()
+
+    hits = sum(v for (n, l), v in counters.items() if n == "schoolhub_cache_requests_total" and ("result", "hit") in l)
+    lookups = sum(v for (n, l), v in counters.items() if n == "schoolhub_cache_requests_total")
+
+    samples = {}
+    for (name, labels), value in sorted(counters.items()):
+        samples.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+    if lookups:
+        samples["schoolhub_cache_hit_ratio"] = [f"schoolhub_cache_hit_ratio {hits / lookups!r}"]
+    for name, labels, value in business_gauges():
+        samples.setdefault(name, []).append(f"{name}{_labels(tuple(map(tuple, labels)))} {value}")
+
+    for (name, labels), counts in sorted(histograms.items()):
+        lines = samples.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels((*labels, ('le', str(bound))))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {counts[-1]!r}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    output = []
+    for name, (kind, help_text) in METRICS.items():
+        if name in samples:
+            output += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", *samples[name]]
+    return "\n".join(output) + "\n"
+
+
+# Instrumentation
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        duration = time.perf_counter() - start
+
+        # URL names keep the label set small; anything that didn't resolve is lumped together
+        match = request.resolver_match
+        view = (("view", match.view_name if match else "unmatched"),)
+
+        observe("schoolhub_http_request_duration_seconds", view, duration)
+        inc("schoolhub_http_requests_total", (*view, ("status", str(response.status_code))))
+        if queries[0]:
+            inc("schoolhub_http_request_db_queries_total", view, queries[0])
+        maybe_flush()
+        return response
+
+
+def count_queries(execute, sql, params, many, context):
+    inc("schoolhub_db_queries_total", (("alias", context["connection"].alias),))
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+
+_MISSING = object()
+
+
+class MeteredCacheMixin:
+    """Counts hits and misses. get_or_set() and the default get_many() go through get()."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        inc("schoolhub_cache_requests_total", (("result", "miss" if value is _MISSING else "hit"),))
+        return default if value is _MISSING else value
+
+
+class LocMemCache(MeteredCacheMixin, locmem.LocMemCache):
+    pass
+
+
+class RedisCache(MeteredCacheMixin, redis.RedisCache):
+    pass
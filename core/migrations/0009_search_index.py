@@ -0,0 +1,51 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS core_search "
+            "USING fts5(title, body, classroom_id UNINDEXED, tokenize='porter unicode61')"
+        )
+        # existing rows, same rowid scheme as core/search.py (id * 4 + kind)
+        schema_editor.execute(
+            "INSERT INTO core_search (rowid, title, body, classroom_id) "
+            "SELECT id * 4 + 0, title, description, classroom_id FROM core_assignment"
+        )
+        schema_editor.execute(
+            "INSERT INTO core_search (rowid, title, body, classroom_id) "
+            "SELECT id * 4 + 1, name, description, id FROM core_classroom"
+        )
+
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS core_assignment_search_idx ON core_assignment "
+            "USING GIN (to_tsvector('english', title || ' ' || description))"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS core_classroom_search_idx ON core_classroom "
+            "USING GIN (to_tsvector('english', name || ' ' || description))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS core_search")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS core_assignment_search_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS core_classroom_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_calendar_feeds'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
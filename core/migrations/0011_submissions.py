@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:07
+
+import core.storage
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_content_addressed_banners'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='max_upload_mb',
+            field=models.PositiveIntegerField(default=25),
+        ),
+        migrations.CreateModel(
+            name='SubmissionUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('received', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='core.assignment')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(max_length=255, storage=core.storage.SubmissionStorage(), upload_to=core.storage.submission_upload_to)),
+                ('original_name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('submitted_at', models.DateTimeField(auto_now_add=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='core.assignment')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['assignment', '-submitted_at'], name='submission_list_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:24
+
+import core.storage
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    # sqlite: archived rows go into core_search like everything else (kind 2)
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS core_archivedassignment_search_idx ON core_archivedassignment "
+            "USING GIN (to_tsvector('english', title || ' ' || description))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS core_archivedassignment_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_reminder_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAssignment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('due_date', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('max_upload_mb', models.PositiveIntegerField(default=25)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_assignments', to='core.classroom')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedSubmission',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('file', models.FileField(max_length=255, storage=core.storage.SubmissionStorage(), upload_to=core.storage.submission_upload_to)),
+                ('original_name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('submitted_at', models.DateTimeField()),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='core.archivedassignment')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedassignment',
+            index=models.Index(fields=['classroom', '-due_date'], name='archived_assignment_list_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
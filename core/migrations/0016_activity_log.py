@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_gradebook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('login', 'Logged in'), ('login_failed', 'Failed login'), ('class_created', 'Created a class'), ('joined', 'Joined a class'), ('assignment_created', 'Created an assignment'), ('appearance_changed', 'Changed class appearance')], max_length=32)),
+                ('detail', models.CharField(blank=True, max_length=255)),
+                ('ip', models.GenericIPAddressField(null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('classroom', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.classroom')),
+                ('user', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-id'], name='activity_user_idx'), models.Index(fields=['classroom', '-id'], name='activity_classroom_idx'), models.Index(fields=['created_at'], name='activity_created_idx')],
+            },
+        ),
+    ]
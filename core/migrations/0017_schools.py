@@ -0,0 +1,115 @@
+import core.tenancy
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+TENANT_MODELS = ("user", "classroom", "enrollment", "assignment", "activityevent")
+
+
+def create_default_school(apps, schema_editor):
+    # everything that exists so far becomes the default school's
+    School = apps.get_model("core", "School")
+    school, _ = School.objects.get_or_create(slug=settings.DEFAULT_SCHOOL_SLUG, defaults={"name": "SchoolHub"})
+    for name in TENANT_MODELS:
+        apps.get_model("core", name)._base_manager.update(school=school)
+
+
+def school_field(**kwargs):
+    return core.tenancy.SchoolField(
+        on_delete=django.db.models.deletion.PROTECT, related_name="+", to="core.school", **kwargs
+    )
+
+
+def activity_school_field(**kwargs):
+    return core.tenancy.SchoolField(
+        db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING,
+        related_name="+", to="core.school", **kwargs
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_activity_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='School',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', core.tenancy.TenantUserManager()),
+            ],
+        ),
+
+        # nullable first, filled in, then required
+        migrations.AddField(model_name='user', name='school', field=school_field(null=True)),
+        migrations.AddField(model_name='classroom', name='school', field=school_field(null=True, db_index=False)),
+        migrations.AddField(model_name='enrollment', name='school', field=school_field(null=True, db_index=False)),
+        migrations.AddField(model_name='assignment', name='school', field=school_field(null=True, db_index=False)),
+        migrations.AddField(model_name='activityevent', name='school', field=activity_school_field(null=True)),
+        migrations.RunPython(create_default_school, migrations.RunPython.noop),
+        migrations.AlterField(model_name='user', name='school', field=school_field()),
+        migrations.AlterField(model_name='classroom', name='school', field=school_field(db_index=False)),
+        migrations.AlterField(model_name='enrollment', name='school', field=school_field(db_index=False)),
+        migrations.AlterField(model_name='assignment', name='school', field=school_field(db_index=False)),
+        migrations.AlterField(model_name='activityevent', name='school', field=activity_school_field()),
+
+        # class codes are unique per school now
+        migrations.AlterField(
+            model_name='classroom',
+            name='code',
+            field=models.CharField(blank=True, max_length=8),
+        ),
+        migrations.AddConstraint(
+            model_name='classroom',
+            constraint=models.UniqueConstraint(fields=('school', 'code'), name='classroom_code_per_school'),
+        ),
+
+        # indexes lead with the school
+        migrations.AddIndex(
+            model_name='classroom',
+            index=models.Index(fields=['school', 'teacher'], name='classroom_school_teacher_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['school', 'classroom'], name='enrollment_school_class_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['school', 'student'], name='enrollment_school_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['school', 'classroom', 'due_date'], name='assignment_school_due_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='activityevent',
+            name='activity_user_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='activityevent',
+            name='activity_classroom_idx',
+        ),
+        migrations.AddIndex(
+            model_name='activityevent',
+            index=models.Index(fields=['school', '-id'], name='activity_school_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activityevent',
+            index=models.Index(fields=['school', 'user', '-id'], name='activity_school_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activityevent',
+            index=models.Index(fields=['school', 'classroom', '-id'], name='activity_school_classroom_idx'),
+        ),
+    ]
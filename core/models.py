@@ -2,14 +2,50 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import FileExtensionValidator
 from django.db import models
+from django.db.models.functions import Lower
 from django.conf import settings
+from django.utils import timezone
 from django.utils.crypto import get_random_string
+import hashlib
 import random
+import uuid
+from pathlib import Path
+
+from .storage import ContentAddressedStorage, SubmissionStorage, banner_upload_to, submission_upload_to
+from .tenancy import SchoolField, TenantManager, TenantUserManager
+
+
+class School(models.Model):
+    # A tenant (core/tenancy.py). Users, classes and everything under them
+    # belong to exactly one.
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
 
 
 class User(AbstractUser):
+    # Usernames stay unique across schools, it's what people log in with
+    school = SchoolField(School, on_delete=models.PROTECT, related_name="+")
     is_teacher = models.BooleanField(default=False)
 
+    objects = TenantUserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # prefix search on the roster (core/roster.py)
+            models.Index(Lower("username"), name="user_username_lower_idx"),
+            models.Index(Lower("email"), name="user_email_lower_idx"),
+        ]
+
+    def visible_classrooms(self):
+        # Teachers see what they teach, students what they're enrolled in
+        if self.is_teacher:
+            return Classroom.objects.filter(teacher=self)
+        return Classroom.objects.filter(enrollment__student=self)
+
 
 GRADIENT_PAIRS = [
     ("#ff9966", "#ff5e62"),  # warm sunset
@@ -25,16 +61,32 @@ GRADIENT_PAIRS = [
 ]
 
 
+def gradient_class(start, end):
+    # Named after the colors, so a class name only changes if its colors do
+    digest = hashlib.sha1(f"{start}-{end}".lower().encode("ascii")).hexdigest()[:8]
+    return f"banner-{digest}"
+
+
+def gradient_css():
+    # Contents of core/static/gradients.css (manage.py build_gradient_css)
+    lines = ["/* Generated from GRADIENT_PAIRS by `manage.py build_gradient_css`, don't edit by hand. */"]
+    for start, end in GRADIENT_PAIRS:
+        lines.append(f".{gradient_class(start, end)}{{background-image:linear-gradient(135deg,{start},{end})}}")
+    return "\n".join(lines) + "\n"
+
 
 class Classroom(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    school = SchoolField(School, on_delete=models.PROTECT, db_index=False, related_name="+")
     teacher = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="classes")
-    code = models.CharField(max_length=8, unique=True, blank=True)
+    # unique within the school, see Meta
+    code = models.CharField(max_length=8, blank=True)
 
     # Optional teacher-uploaded banner
     banner_image = models.ImageField(
-        upload_to="class_banners/",
+        upload_to=banner_upload_to,
+        storage=ContentAddressedStorage(),
         blank=True,
         null=True,
         validators=[FileExtensionValidator(["jpg", "jpeg", "png", "webp"])]
@@ -43,7 +95,23 @@ class Classroom(models.Model):
     gradient_start = models.CharField(max_length=7, blank=True)
     gradient_end = models.CharField(max_length=7, blank=True)
 
+    objects = TenantManager()
+    # banner files are shared by content across schools
+    all_objects = models.Manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["school", "code"], name="classroom_code_per_school"),
+        ]
+        indexes = [
+            # the dashboard (and every other per-school lookup by teacher)
+            models.Index(fields=["school", "teacher"], name="classroom_school_teacher_idx"),
+        ]
+
     def save(self, *args, **kwargs):
+        # a class lives at its teacher's school
+        if self._state.adding:
+            self.school_id = self.teacher.school_id
 
         # Generate class code once
         if not self.code:
@@ -57,17 +125,47 @@ class Classroom(models.Model):
 
         super().save(*args, **kwargs)
 
+    @property
+    def banner_class(self):
+        pair = (self.gradient_start, self.gradient_end)
+        if pair not in GRADIENT_PAIRS:
+            # only colors in GRADIENT_PAIRS have CSS, anything else gets a stable stand-in
+            pair = GRADIENT_PAIRS[(self.id or 0) % len(GRADIENT_PAIRS)]
+        return gradient_class(*pair)
+
 
 
 class Enrollment(models.Model):
+    school = SchoolField(School, on_delete=models.PROTECT, db_index=False, related_name="+")
     student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE)
 
+    objects = TenantManager()
+
     class Meta:
         unique_together = ("student", "classroom")
+        indexes = [
+            models.Index(fields=["school", "classroom"], name="enrollment_school_class_idx"),
+            models.Index(fields=["school", "student"], name="enrollment_school_student_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.school_id = self.classroom.school_id
+        super().save(*args, **kwargs)
+
+    # The grades go with an enrollment, and AssignmentStats has to follow:
+    # delete through here or grades.remove_enrollments(), not a bare
+    # queryset .delete() (`manage.py check_grade_stats --fix` repairs that).
+    # Deleting a whole classroom is fine, its assignments go too.
+    def delete(self, *args, **kwargs):
+        from . import grades  # grades imports this module
+
+        return grades.remove_enrollments(type(self)._base_manager.filter(pk=self.pk))
 
 
 class Assignment(models.Model):
+    school = SchoolField(School, on_delete=models.PROTECT, db_index=False, related_name="+")
     classroom = models.ForeignKey(
         Classroom,
         on_delete=models.CASCADE,
@@ -78,5 +176,227 @@ class Assignment(models.Model):
     due_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # per-assignment limit for a single submitted file
+    max_upload_mb = models.PositiveIntegerField(default=25)
+
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [
+            # class pages: one class's assignments by due date
+            models.Index(fields=["school", "classroom", "due_date"], name="assignment_school_due_idx"),
+        ]
+
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.school_id = self.classroom.school_id
+        super().save(*args, **kwargs)
+
+    @property
+    def max_upload_bytes(self):
+        return self.max_upload_mb * 1024 * 1024
+
+
+class Submission(models.Model):
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name="submissions")
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="submissions")
+    file = models.FileField(upload_to=submission_upload_to, storage=SubmissionStorage(), max_length=255)
+    original_name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    submitted_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TenantManager("assignment__school")
+
+    class Meta:
+        indexes = [
+            # the teacher's list: one assignment, newest first
+            models.Index(fields=["assignment", "-submitted_at"], name="submission_list_idx"),
+        ]
+
+
+class SubmissionUpload(models.Model):
+    # A resumable upload in progress. Bytes go to SUBMISSIONS_ROOT/partial/<id>.part
+    # and become a Submission once all `size` bytes are in.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name="uploads")
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def partial_path(self):
+        return Path(settings.SUBMISSIONS_ROOT) / "partial" / f"{self.id.hex}.part"
+
+
+class ReminderLog(models.Model):
+    # One row per (assignment, student) reminder that went out, so
+    # send_reminders can run as often as it likes without repeating itself.
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name="+")
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["student", "assignment"], name="one_reminder_per_assignment"),
+        ]
+
+
+class Grade(models.Model):
+    # A score out of 100. Write through core/grades.py so the summary tables
+    # below stay in step.
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name="grades")
+    enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name="grades")
+    score = models.DecimalField(max_digits=5, decimal_places=2)
+    graded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["assignment", "enrollment"], name="one_grade_per_assignment"),
+        ]
+
+
+class AssignmentStats(models.Model):
+    # Summary of one assignment's grades, rewritten whenever they change so
+    # the gradebook never has to read the grades themselves.
+    HISTOGRAM_BUCKETS = 10  # 0-9, 10-19, ..., 90-100
+
+    assignment = models.OneToOneField(Assignment, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    count = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(null=True)
+    median = models.FloatField(null=True)
+    histogram = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def histogram_bars(self):
+        # (count, height in % of the tallest bucket) for the template
+        tallest = max(self.histogram, default=0) or 1
+        return [(count, round(count * 100 / tallest)) for count in self.histogram]
+
+
+class EnrollmentStats(models.Model):
+    # One student's average in one class
+    enrollment = models.OneToOneField(Enrollment, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    count = models.PositiveIntegerField(default=0)
+    average = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ArchivedAssignment(models.Model):
+    # Cold storage for old assignments (manage.py archive). Rows keep the id
+    # they had as an Assignment, and their submissions keep their files.
+    id = models.BigIntegerField(primary_key=True)
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name="archived_assignments")
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    due_date = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    max_upload_mb = models.PositiveIntegerField(default=25)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    objects = TenantManager("classroom__school")
+
+    class Meta:
+        indexes = [
+            # the past tab: one class, latest due first
+            models.Index(fields=["classroom", "-due_date"], name="archived_assignment_list_idx"),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class ArchivedSubmission(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    assignment = models.ForeignKey(ArchivedAssignment, on_delete=models.CASCADE, related_name="submissions")
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    file = models.FileField(upload_to=submission_upload_to, storage=SubmissionStorage(), max_length=255)
+    original_name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    submitted_at = models.DateTimeField()
+
+    objects = TenantManager("assignment__classroom__school")
+
+
+class ArchivedGrade(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    assignment = models.ForeignKey(ArchivedAssignment, on_delete=models.CASCADE, related_name="grades")
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    score = models.DecimalField(max_digits=5, decimal_places=2)
+    graded_at = models.DateTimeField()
+
+
+class CalendarToken(models.Model):
+    # Calendar apps can't log in, so the feed URL carries this instead.
+    # Revoking = deleting the row (a new one gets a fresh token).
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="calendar_token")
+    token = models.CharField(max_length=40, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TenantManager("user__school")
+
+    def save(self, *args, **kwargs):
+        if not self.token:
+            self.token = get_random_string(40)
+        super().save(*args, **kwargs)
+
+
+class ClassroomCalendar(models.Model):
+    # Pre-rendered VEVENT lines for one classroom. The row gets deleted whenever
+    # one of the class's assignments changes and is rebuilt on the next poll.
+    classroom = models.OneToOneField(Classroom, on_delete=models.CASCADE, related_name="calendar")
+    events = models.TextField(blank=True)
+    etag = models.CharField(max_length=64)
+    updated_at = models.DateTimeField()
+
+
+class ActivityEvent(models.Model):
+    # Audit trail for support, written in batches by core/activity.py. No
+    # database-level foreign keys: a row has to outlive the user or class it
+    # mentions, and inserts shouldn't pay for constraint checks.
+    LOGIN = "login"
+    LOGIN_FAILED = "login_failed"
+    CLASS_CREATED = "class_created"
+    JOINED = "joined"
+    ASSIGNMENT_CREATED = "assignment_created"
+    APPEARANCE_CHANGED = "appearance_changed"
+    ACTIONS = [
+        (LOGIN, "Logged in"),
+        (LOGIN_FAILED, "Failed login"),
+        (CLASS_CREATED, "Created a class"),
+        (JOINED, "Joined a class"),
+        (ASSIGNMENT_CREATED, "Created an assignment"),
+        (APPEARANCE_CHANGED, "Changed class appearance"),
+    ]
+
+    school = SchoolField(School, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name="+")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    classroom = models.ForeignKey(
+        Classroom, null=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    action = models.CharField(max_length=32, choices=ACTIONS)
+    detail = models.CharField(max_length=255, blank=True)
+    ip = models.GenericIPAddressField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [
+            # the activity page: newest first for the school, one user or one class
+            models.Index(fields=["school", "-id"], name="activity_school_idx"),
+            models.Index(fields=["school", "user", "-id"], name="activity_school_user_idx"),
+            models.Index(fields=["school", "classroom", "-id"], name="activity_school_classroom_idx"),
+            # pruning
+            models.Index(fields=["created_at"], name="activity_created_idx"),
+        ]
@@ -0,0 +1,127 @@
+# Deadline reminder digests (manage.py send_reminders).
+#
+# One email per student listing everything due in the window across all
+# their classes. Works in batches of students: each batch is one query for
+# what was already sent, one bulk_create of ReminderLog rows and one SMTP
+# connection, never a query per student. The log rows are written for
+# exactly the messages the server accepted, even when sending fails halfway
+# through a batch, so a rerun picks up the rest without repeating anyone.
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import Assignment, Enrollment, ReminderLog
+
+
+def due_assignments(start, end):
+    """{classroom_id: [assignment dict, ...]} for assignments due between start and end (inclusive)."""
+    by_classroom = {}
+    rows = (
+        Assignment.objects
+        .filter(due_date__range=(start, end))
+        .order_by("due_date", "id")
+        .values("id", "title", "due_date", "classroom_id", "classroom__name")
+    )
+    for row in rows:
+        by_classroom.setdefault(row["classroom_id"], []).append(row)
+    return by_classroom
+
+
+def _students(start, end, chunk_size):
+    # (student_id, email, username, classroom_id), grouped by student
+    return (
+        Enrollment.objects
+        .filter(classroom__in=Assignment.objects.filter(due_date__range=(start, end)).values("classroom_id"))
+        .exclude(student__email="")
+        .order_by("student_id", "classroom_id")
+        .values_list("student_id", "student__email", "student__username", "classroom_id")
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def _batches(rows, size):
+    batch = []
+    for student_id, group in groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        batch.append((student_id, group[0][1], group[0][2], [row[3] for row in group]))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def digest_message(email, username, assignments, today):
+    lines = [f"Hi {username},", "", "Coming up soon:", ""]
+    for assignment in assignments:
+        days = (assignment["due_date"] - today).days
+        due = assignment["due_date"]
+        when = "today" if days == 0 else "tomorrow" if days == 1 else f"on {due:%A, %B} {due.day}"
+        lines.append(f"- {assignment['title']} ({assignment['classroom__name']}), due {when}")
+    lines += ["", "- SchoolHub"]
+
+    count = len(assignments)
+    subject = f"{count} assignment{'s' if count != 1 else ''} due soon"
+    return EmailMessage(subject, "\n".join(lines), settings.DEFAULT_FROM_EMAIL, [email])
+
+
+def _send(messages, logs):
+    # One message per send_messages() call, so when the server gives up we
+    # know which ones it took. Those get logged (and won't go out again),
+    # the rest are left for the next run.
+    sent = 0
+    try:
+        with get_connection() as connection:
+            for message in messages:
+                connection.send_messages([message])
+                sent += 1
+    finally:
+        ReminderLog.objects.bulk_create(
+            [row for rows in logs[:sent] for row in rows], ignore_conflicts=True
+        )
+
+
+def send_reminders(days=1, batch_size=1000, dry_run=False, today=None):
+    """Returns (emails sent, assignment reminders covered)."""
+    today = today or timezone.localdate()
+    end = today + timedelta(days=days)
+
+    by_classroom = due_assignments(today, end)
+    if not by_classroom:
+        return 0, 0
+
+    due_ids = [a["id"] for assignments in by_classroom.values() for a in assignments]
+    sent_emails = sent_reminders = 0
+
+    for batch in _batches(_students(today, end, batch_size), batch_size):
+        already = set(
+            ReminderLog.objects
+            .filter(student_id__in=[b[0] for b in batch], assignment_id__in=due_ids)
+            .values_list("student_id", "assignment_id")
+        )
+
+        messages, logs = [], []  # logs[i]: the ReminderLog rows messages[i] covers
+        for student_id, email, username, classroom_ids in batch:
+            pending = [
+                a for cid in classroom_ids for a in by_classroom.get(cid, [])
+                if (student_id, a["id"]) not in already
+            ]
+            if not pending:
+                continue
+            pending.sort(key=lambda a: (a["due_date"], a["id"]))
+            messages.append(digest_message(email, username, pending, today))
+            logs.append([ReminderLog(student_id=student_id, assignment_id=a["id"]) for a in pending])
+
+        if not messages:
+            continue
+
+        if not dry_run:
+            _send(messages, logs)
+
+        sent_emails += len(messages)
+        sent_reminders += sum(len(rows) for rows in logs)
+
+    return sent_emails, sent_reminders
@@ -0,0 +1,67 @@
+# Class rosters for teachers, as a page and as JSON.
+#
+# Built for lecture-hall classes: one query per page no matter how big the
+# class is. Pages are keyset-paginated on the (unique) username, so page 40
+# costs the same as page 1 and nothing gets counted. Search is a prefix match
+# on username or email written as a range over lower(...), which the
+# functional indexes on User can answer.
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .models import Enrollment
+
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+FIELDS = ("student__username", "student__email", "student__first_name", "student__last_name")
+
+
+def _prefix_range(text):
+    # "abc" -> ["abc", "abd"): everything starting with abc
+    return text, text[:-1] + chr(ord(text[-1]) + 1)
+
+
+def roster_page(classroom, query="", after=None, limit=PAGE_SIZE):
+    """One page of a class's enrollments ordered by username.
+
+    Returns (enrollments, next cursor). The cursor is the last username on
+    the page, or None on the last page.
+    """
+    enrollments = (
+        Enrollment.objects
+        .filter(classroom=classroom)
+        .select_related("student")
+        .only("id", "student", *FIELDS)
+    )
+
+    query = query.strip().lower()
+    if query:
+        start, end = _prefix_range(query)
+        enrollments = enrollments.alias(
+            username_lower=Lower("student__username"),
+            email_lower=Lower("student__email"),
+        ).filter(
+            Q(username_lower__gte=start, username_lower__lt=end)
+            | Q(email_lower__gte=start, email_lower__lt=end)
+        )
+
+    if after:
+        enrollments = enrollments.filter(student__username__gt=after)
+
+    # one extra row tells us whether there's another page
+    rows = list(enrollments.order_by("student__username")[:limit + 1])
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].student.username
+    return rows, None
+
+
+def as_json(enrollment):
+    student = enrollment.student
+    return {
+        "id": student.id,
+        "username": student.username,
+        "email": student.email,
+        "first_name": student.first_name,
+        "last_name": student.last_name,
+    }
@@ -0,0 +1,88 @@
+# Read replica routing.
+#
+# Views decorated with @replica_reads send their reads (GET/HEAD only) to
+# one of settings.DATABASE_REPLICAS. Everything else, every write, and every
+# read that follows a write goes to "default":
+#  - inside a request, the first write pins the rest of it to the primary;
+#  - after a request that wrote (or any POST), a short-lived cookie pins the
+#    browser's next requests too, so the redirect after create_assignment or
+#    join_classroom shows the new rows even if the replica is behind.
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+PIN_COOKIE = "db_pin"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_request_state = ContextVar("db_routing", default=None)
+
+
+def replica_reads(view):
+    view.replica_reads = True
+    return view
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if not state or not state["replica"] or state["pinned"] or not settings.DATABASE_REPLICAS:
+            return None
+        if model._meta.app_label == "sessions":
+            # a session the replica hasn't seen yet would log the user out
+            return None
+        # stick to one replica for the whole request
+        if state["alias"] is None:
+            state["alias"] = random.choice(settings.DATABASE_REPLICAS)
+        return state["alias"]
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state["pinned"] = True
+            state["wrote"] = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {
+            "replica": False,
+            "pinned": PIN_COOKIE in request.COOKIES,
+            "wrote": False,
+            "alias": None,
+        }
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if state["wrote"] or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request_state.get()
+        if state is not None and request.method in ("GET", "HEAD") and getattr(view_func, "replica_reads", False):
+            state["replica"] = True
+        return None
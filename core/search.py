@@ -0,0 +1,211 @@
+# Full-text search over assignments and classrooms.
+#
+# SQLite: an FTS5 table (core_search) kept in sync from signals.py. Every
+# document's rowid is object id * KIND_SLOTS + kind, so updating or deleting
+# one is a rowid lookup instead of a scan.
+# Postgres: GIN expression indexes on to_tsvector(...), which the database
+# keeps up to date by itself.
+# Anything else falls back to icontains.
+import re
+
+from django.db import connection
+
+from .models import ArchivedAssignment, Assignment, Classroom
+
+
+KIND_ASSIGNMENT = 0
+KIND_CLASSROOM = 1
+KIND_ARCHIVED = 2  # ArchivedAssignment, only searched when asked for
+KIND_SLOTS = 4  # room for more kinds without renumbering rowids
+
+PAGE_SIZE = 20
+
+FTS_TABLE = "core_search"
+
+# Postgres expressions, these must match the indexes in the migration exactly
+PG_ASSIGNMENT_VECTOR = "to_tsvector('english', title || ' ' || description)"
+PG_CLASSROOM_VECTOR = "to_tsvector('english', name || ' ' || description)"
+PG_ARCHIVED_VECTOR = PG_ASSIGNMENT_VECTOR
+
+
+def _fts_query(text):
+    # Never hand raw user input to MATCH, FTS5 has its own query syntax.
+    # Every word becomes a quoted prefix term and all of them must match.
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{w}"*' for w in words[:10])
+
+
+# ---- keeping the index in sync ----
+
+def index_document(kind, object_id, classroom_id, title, body):
+    if connection.vendor != "sqlite":
+        return
+    rowid = object_id * KIND_SLOTS + kind
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [rowid])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, body, classroom_id) VALUES (%s, %s, %s, %s)",
+            [rowid, title, body, classroom_id],
+        )
+
+
+def remove_document(kind, object_id):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [object_id * KIND_SLOTS + kind])
+
+
+def remove_documents(kind, object_ids):
+    """Drop a batch of documents of one kind in one statement."""
+    if connection.vendor != "sqlite" or not object_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(object_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+            [object_id * KIND_SLOTS + kind for object_id in object_ids],
+        )
+
+
+def index_assignment(assignment):
+    index_document(KIND_ASSIGNMENT, assignment.id, assignment.classroom_id, assignment.title, assignment.description)
+
+
+def index_classroom(classroom):
+    index_document(KIND_CLASSROOM, classroom.id, classroom.id, classroom.name, classroom.description)
+
+
+def index_archived(ids):
+    """Index a batch of freshly archived assignments in one statement."""
+    if connection.vendor != "sqlite" or not ids:
+        return
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, body, classroom_id) "
+            f"SELECT id * {KIND_SLOTS} + {KIND_ARCHIVED}, title, description, classroom_id "
+            f"FROM core_archivedassignment WHERE id IN ({placeholders})",
+            ids,
+        )
+
+
+def rebuild():
+    """Throw away the FTS5 table contents and re-index everything with INSERT ... SELECTs."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, body, classroom_id) "
+            f"SELECT id * {KIND_SLOTS} + {KIND_ASSIGNMENT}, title, description, classroom_id FROM core_assignment"
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, body, classroom_id) "
+            f"SELECT id * {KIND_SLOTS} + {KIND_CLASSROOM}, name, description, id FROM core_classroom"
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, body, classroom_id) "
+            f"SELECT id * {KIND_SLOTS} + {KIND_ARCHIVED}, title, description, classroom_id FROM core_archivedassignment"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+# ---- querying ----
+
+def _sqlite_hits(text, classrooms, limit, offset, archived):
+    match = _fts_query(text)
+    if not match:
+        return []
+    # The classrooms go in as a subquery: SQLite builds it into a temporary
+    # index once, where a list of ids would be one bound parameter per class
+    # (and fail past 999 of them on older builds)
+    visible, params = classrooms.query.sql_with_params()
+    kinds = "" if archived else f"AND rowid %% {KIND_SLOTS} != {KIND_ARCHIVED} "
+    with connection.cursor() as cursor:
+        # bm25 weights: title matters more than the body
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND classroom_id IN ({visible}) {kinds}"
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s OFFSET %s",
+            [match, *params, limit, offset],
+        )
+        return [divmod(rowid, KIND_SLOTS)[::-1] for (rowid,) in cursor.fetchall()]
+
+
+def _postgres_hits(text, classrooms, limit, offset, archived):
+    visible, visible_params = classrooms.query.sql_with_params()
+    params = [text, *visible_params, text, *visible_params]
+    archive = ""
+    if archived:
+        archive = (
+            f"  UNION ALL"
+            f"  SELECT {KIND_ARCHIVED} AS kind, id, ts_rank({PG_ARCHIVED_VECTOR}, q) AS rank"
+            f"  FROM core_archivedassignment, websearch_to_tsquery('english', %s) q"
+            f"  WHERE classroom_id IN ({visible}) AND {PG_ARCHIVED_VECTOR} @@ q"
+        )
+        params += [text, *visible_params]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT kind, id FROM ("
+            f"  SELECT {KIND_ASSIGNMENT} AS kind, id, ts_rank({PG_ASSIGNMENT_VECTOR}, q) AS rank"
+            f"  FROM core_assignment, websearch_to_tsquery('english', %s) q"
+            f"  WHERE classroom_id IN ({visible}) AND {PG_ASSIGNMENT_VECTOR} @@ q"
+            f"  UNION ALL"
+            f"  SELECT {KIND_CLASSROOM} AS kind, id, ts_rank({PG_CLASSROOM_VECTOR}, q) AS rank"
+            f"  FROM core_classroom, websearch_to_tsquery('english', %s) q"
+            f"  WHERE id IN ({visible}) AND {PG_CLASSROOM_VECTOR} @@ q"
+            f"{archive}"
+            f") hits ORDER BY rank DESC, kind, id LIMIT %s OFFSET %s",
+            [*params, limit, offset],
+        )
+        return cursor.fetchall()
+
+
+def _fallback_hits(text, classrooms, limit, offset, archived):
+    names = Classroom.objects.filter(id__in=classrooms, name__icontains=text).values_list("id", flat=True)
+    assignments = Assignment.objects.filter(classroom_id__in=classrooms, title__icontains=text).values_list("id", flat=True)
+    hits = [(KIND_CLASSROOM, pk) for pk in names.order_by("id")] + \
+           [(KIND_ASSIGNMENT, pk) for pk in assignments.order_by("-id")]
+    if archived:
+        old = ArchivedAssignment.objects.filter(classroom_id__in=classrooms, title__icontains=text)
+        hits += [(KIND_ARCHIVED, pk) for pk in old.order_by("-id").values_list("id", flat=True)]
+    return hits[offset:offset + limit]
+
+
+def search(user, text, page=1, archived=False):
+    """One page of ranked results the user is allowed to see.
+
+    Returns (results, has_next) where results is a list of Assignment and
+    Classroom objects in rank order, plus ArchivedAssignments if `archived`.
+    """
+    text = text.strip()
+    if not text:
+        return [], False
+    classrooms = user.visible_classrooms().values("id")
+
+    offset = (page - 1) * PAGE_SIZE
+    if connection.vendor == "sqlite":
+        finder = _sqlite_hits
+    elif connection.vendor == "postgresql":
+        finder = _postgres_hits
+    else:
+        finder = _fallback_hits
+
+    # ask for one extra row to know whether there's a next page
+    hits = finder(text, classrooms, PAGE_SIZE + 1, offset, archived)
+    has_next = len(hits) > PAGE_SIZE
+    hits = hits[:PAGE_SIZE]
+
+    assignments = Assignment.objects.select_related("classroom").in_bulk(
+        [pk for kind, pk in hits if kind == KIND_ASSIGNMENT]
+    )
+    classrooms = Classroom.objects.in_bulk([pk for kind, pk in hits if kind == KIND_CLASSROOM])
+    objects = {KIND_ASSIGNMENT: assignments, KIND_CLASSROOM: classrooms}
+    if archived:
+        objects[KIND_ARCHIVED] = ArchivedAssignment.objects.select_related("classroom").in_bulk(
+            [pk for kind, pk in hits if kind == KIND_ARCHIVED]
+        )
+
+    results = [objects[kind][pk] for kind, pk in hits if pk in objects.get(kind, {})]
+    return results, has_next
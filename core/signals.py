@@ -0,0 +1,82 @@
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import activity, grades, ical, metrics, search, tenancy
+from .models import ActivityEvent, ArchivedAssignment, Assignment, Classroom, Enrollment, School, User
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def assignment_changed(sender, instance, **kwargs):
+    ical.invalidate(instance.classroom_id)
+
+
+@receiver(post_save, sender=Assignment)
+def index_assignment(sender, instance, **kwargs):
+    search.index_assignment(instance)
+
+
+@receiver(post_delete, sender=Assignment)
+def unindex_assignment(sender, instance, **kwargs):
+    search.remove_document(search.KIND_ASSIGNMENT, instance.id)
+
+
+@receiver(post_delete, sender=ArchivedAssignment)
+def unindex_archived_assignment(sender, instance, **kwargs):
+    search.remove_document(search.KIND_ARCHIVED, instance.id)
+
+
+@receiver(post_save, sender=Classroom)
+def classroom_changed(sender, instance, created, **kwargs):
+    # the class name is part of every event summary
+    if not created:
+        ical.invalidate(instance.id)
+    search.index_classroom(instance)
+
+
+@receiver(post_delete, sender=Classroom)
+def unindex_classroom(sender, instance, **kwargs):
+    search.remove_document(search.KIND_CLASSROOM, instance.id)
+
+
+@receiver(pre_delete, sender=User)
+def forget_student_grades(sender, instance, **kwargs):
+    # A student's enrollments (and grades) cascade with the account. One query
+    # per account, where a receiver on Enrollment would cost one per class
+    # and slow down deleting a whole classroom.
+    if not instance.is_teacher:
+        grades.refresh_after_commit(grades.assignments_graded_for(Enrollment.objects.filter(student=instance)))
+
+
+@receiver(post_save, sender=School)
+@receiver(post_delete, sender=School)
+def school_changed(sender, instance, **kwargs):
+    tenancy.forget_schools()
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    # Django reconnects on the same wrapper object (every request with
+    # CONN_MAX_AGE=0), install the counter once
+    if metrics.count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.count_queries)
+
+
+@receiver(user_logged_in)
+def login_succeeded(sender, request, user, **kwargs):
+    metrics.inc("schoolhub_logins_total", (("result", "success"),))
+    activity.record(ActivityEvent.LOGIN, request, user=user)
+
+
+@receiver(user_login_failed)
+def login_failed(sender, credentials, request=None, **kwargs):
+    metrics.inc("schoolhub_logins_total", (("result", "failure"),))
+    activity.record(ActivityEvent.LOGIN_FAILED, request, detail=credentials.get("username") or "")
+
+
+@receiver(request_finished)
+def flush_activity(sender, **kwargs):
+    activity.maybe_flush()
@@ -0,0 +1,117 @@
+// Resumable, chunked submission uploads.
+// Without this script the form still works as a normal multipart post.
+document.addEventListener("DOMContentLoaded", () => {
+    const form = document.querySelector("#submission-form");
+    if (!form || !window.fetch) {
+        return;
+    }
+
+    const input = form.querySelector("input[type=file]");
+    const progress = form.querySelector(".progress");
+    const bar = form.querySelector(".progress-bar");
+    const csrf = form.querySelector("[name=csrfmiddlewaretoken]").value;
+    const uploadUrl = (id) => form.dataset.uploadUrl.replace("00000000-0000-0000-0000-000000000000", id);
+
+    function showProgress(done, total) {
+        progress.classList.remove("d-none");
+        bar.style.width = `${Math.floor((done / total) * 100)}%`;
+    }
+
+    function fail(message) {
+        progress.classList.add("d-none");
+        alert(message);
+    }
+
+    // Remember unfinished uploads so a reload (or a dead connection) picks up where it stopped
+    function storageKey(file) {
+        return `upload:${form.action}:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    async function startOrResume(file) {
+        const saved = localStorage.getItem(storageKey(file));
+        if (saved) {
+            const response = await fetch(uploadUrl(saved));
+            if (response.ok) {
+                const state = await response.json();
+                return {id: saved, offset: state.offset};
+            }
+            localStorage.removeItem(storageKey(file));
+        }
+
+        const body = new FormData();
+        body.append("filename", file.name);
+        body.append("size", file.size);
+        const response = await fetch(form.dataset.startUrl, {
+            method: "POST",
+            headers: {"X-CSRFToken": csrf},
+            body,
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || "Upload failed.");
+        }
+        localStorage.setItem(storageKey(file), data.id);
+        return {id: data.id, offset: data.offset, chunkSize: data.chunk_size};
+    }
+
+    async function upload(file) {
+        let {id, offset, chunkSize} = await startOrResume(file);
+        chunkSize = chunkSize || 4 * 1024 * 1024;
+
+        while (offset < file.size) {
+            showProgress(offset, file.size);
+            const chunk = file.slice(offset, offset + chunkSize);
+            let response;
+            try {
+                response = await fetch(uploadUrl(id), {
+                    method: "PATCH",
+                    headers: {
+                        "X-CSRFToken": csrf,
+                        "Upload-Offset": offset,
+                        "Content-Type": "application/octet-stream",
+                    },
+                    body: chunk,
+                });
+            } catch (error) {
+                // network hiccup: wait a bit, ask the server where we are, go again
+                await new Promise((resolve) => setTimeout(resolve, 2000));
+                const state = await fetch(uploadUrl(id)).then((r) => r.json());
+                offset = state.offset;
+                continue;
+            }
+
+            const data = await response.json();
+            if (response.status === 409) {
+                offset = data.offset;
+                continue;
+            }
+            if (!response.ok) {
+                throw new Error(data.error || "Upload failed.");
+            }
+            offset = data.offset;
+        }
+
+        localStorage.removeItem(storageKey(file));
+        showProgress(file.size, file.size);
+    }
+
+    form.addEventListener("submit", async (event) => {
+        const file = input.files[0];
+        if (!file) {
+            return;
+        }
+        event.preventDefault();
+
+        if (file.size > Number(form.dataset.maxBytes)) {
+            fail("That file is larger than this assignment allows.");
+            return;
+        }
+
+        try {
+            await upload(file);
+            window.location.reload();
+        } catch (error) {
+            fail(error.message);
+        }
+    });
+});
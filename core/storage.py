@@ -0,0 +1,78 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+# "<32 hex chars>.<ext>", what content_addressed_name() produces
+CONTENT_ADDRESSED_RE = re.compile(r"(?:^|/)([0-9a-f]{32})\.[A-Za-z0-9]+$")
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()[:32]
+
+
+def content_addressed_name(directory, file, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return f"{directory}/{content_hash(file)}{ext}"
+
+
+def banner_upload_to(instance, filename):
+    # Same bytes -> same name, so the URL can be cached forever
+    return content_addressed_name("class_banners", instance.banner_image.file, filename)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that treats an existing file with the same name as already saved.
+
+    Names come from the file's hash, so an existing file is the same file.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if CONTENT_ADDRESSED_RE.search(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if CONTENT_ADDRESSED_RE.search(name) and self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_ADDRESSED_RE.search(name))
+
+
+@deconstructible
+class SubmissionStorage(FileSystemStorage):
+    """Student work, kept under SUBMISSIONS_ROOT instead of MEDIA_ROOT.
+
+    Nothing in there has a public URL, files go out through a permission
+    checked view (views.download_submission).
+    """
+
+    @property
+    def base_location(self):
+        return settings.SUBMISSIONS_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
+
+
+def submission_upload_to(instance, filename):
+    ext = os.path.splitext(filename)[1].lower()[:10]
+    return f"{instance.assignment_id}/{uuid.uuid4().hex}{ext}"
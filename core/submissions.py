@@ -0,0 +1,211 @@
+# Getting student files onto disk without holding them in memory.
+#
+# Two ways in:
+#  - a plain multipart form post, parsed by Django's TemporaryFileUploadHandler
+#    (straight to a temp file) behind QuotaUploadHandler, which stops reading
+#    as soon as the assignment's limit is passed. UploadLimitMiddleware puts
+#    the handlers in place for views marked with @upload_limit, before the
+#    CSRF check is the first thing to read the body;
+#  - a resumable upload: the browser creates a SubmissionUpload, then PATCHes
+#    the file in pieces of at most SUBMISSION_CHUNK_SIZE. Each piece is a short
+#    request, so a slow connection never holds a worker for the whole file, and
+#    a dropped connection resumes from SubmissionUpload.received.
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: fine for a single dev server
+    fcntl = None
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload, TemporaryFileUploadHandler
+from django.db import transaction
+
+from .models import Submission, SubmissionUpload
+from .storage import submission_upload_to
+
+
+READ_SIZE = 64 * 1024
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class OffsetMismatch(Exception):
+    pass
+
+
+class QuotaUploadHandler(FileUploadHandler):
+    """Goes first in request.upload_handlers and cuts the upload off past `limit` bytes."""
+
+    def __init__(self, limit, request=None):
+        super().__init__(request)
+        self.limit = limit
+        self.received = 0
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            self.exceeded = True
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def request_too_large(request, limit):
+    # Checked before anything reads the body. A little slack for the multipart envelope.
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return False
+    return length > limit + READ_SIZE
+
+
+def upload_limit(get_limit):
+    """Mark a view whose uploads are cut off at get_limit(*view_args, **view_kwargs) bytes.
+
+    get_limit returns None when there's no limit to apply (the view will 404).
+    The view finds the QuotaUploadHandler in request.upload_quota.
+    """
+    def mark(view):
+        view.upload_limit = get_limit
+        return view
+    return mark
+
+
+class UploadLimitMiddleware:
+    # Goes right before CsrfViewMiddleware
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        get_limit = getattr(view_func, "upload_limit", None)
+        if get_limit is None or request.method != "POST":
+            return None
+        limit = get_limit(*view_args, **view_kwargs)
+        if limit is None:
+            return None
+
+        # never buffer in memory, and stop reading the moment the limit is
+        # passed (right away, if Content-Length already says it will be)
+        quota = QuotaUploadHandler(0 if request_too_large(request, limit) else limit, request)
+        request.upload_quota = quota
+        request.upload_handlers = [quota, TemporaryFileUploadHandler(request)]
+        return None
+
+
+def start_upload(assignment, student, filename, size):
+    if size > assignment.max_upload_bytes:
+        raise QuotaExceeded
+
+    upload = SubmissionUpload.objects.create(
+        assignment=assignment,
+        student=student,
+        filename=os.path.basename(filename)[:255] or "upload",
+        size=size,
+    )
+    upload.partial_path.parent.mkdir(parents=True, exist_ok=True)
+    upload.partial_path.touch()
+    return upload
+
+
+def append_chunk(upload, offset, stream, length):
+    """Write `length` bytes from `stream` at `offset`. Returns the Submission once complete.
+
+    Two PATCHes for the same offset (a client retrying while the first is
+    still going) must not both write: the second waits for the first and
+    then gets OffsetMismatch.
+    """
+    if offset >= upload.size:
+        # nothing left to write; also keeps a late retry from finishing it twice
+        raise OffsetMismatch
+    if length > settings.SUBMISSION_CHUNK_SIZE or offset + length > upload.size:
+        raise QuotaExceeded
+
+    try:
+        f = open(upload.partial_path, "r+b")
+    except FileNotFoundError:  # finished or discarded meanwhile
+        raise OffsetMismatch
+    with f:
+        # The row lock covers Postgres. SQLite ignores select_for_update, so
+        # the partial file is locked too, before the transaction starts so
+        # nobody waits on it while holding the database.
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        with transaction.atomic():
+            received = (
+                SubmissionUpload.objects.select_for_update()
+                .filter(pk=upload.pk).values_list("received", flat=True).first()
+            )
+            if received is None:
+                raise OffsetMismatch
+            upload.received = received
+            if offset != received:
+                raise OffsetMismatch
+
+            # anything past `received` is left over from a chunk that died halfway
+            f.truncate(offset)
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                f.write(data)
+                remaining -= len(data)
+            f.flush()
+
+            upload.received = offset + length - remaining
+            upload.save(update_fields=["received", "updated_at"])
+
+    if upload.received == upload.size:
+        return finish_upload(upload)
+    return None
+
+
+def finish_upload(upload):
+    submission = Submission(
+        assignment=upload.assignment,
+        student=upload.student,
+        original_name=upload.filename,
+        size=upload.size,
+    )
+    name = submission_upload_to(submission, upload.filename)
+    storage = Submission._meta.get_field("file").storage
+
+    # a rename, not a copy
+    target = storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(upload.partial_path, target)
+
+    with transaction.atomic():
+        submission.file.name = name
+        submission.save()
+        upload.delete()
+    return submission
+
+
+def save_uploaded_file(assignment, student, uploaded):
+    return Submission.objects.create(
+        assignment=assignment,
+        student=student,
+        file=uploaded,
+        original_name=os.path.basename(uploaded.name)[:255],
+        size=uploaded.size,
+    )
+
+
+def discard_upload(upload):
+    try:
+        os.remove(upload.partial_path)
+    except FileNotFoundError:
+        pass
+    upload.delete()
@@ -0,0 +1,164 @@
+# Schools (tenants).
+#
+# Every request belongs to one School, found from the subdomain
+# (lincoln.<SCHOOLHUB_BASE_DOMAIN>) or a /s/<slug>/ path prefix, and the
+# default school otherwise. TenantMiddleware keeps it in a contextvar for the
+# length of the request, and while it's set:
+#  - the default manager of every tenant model only sees that school's rows,
+#    so views never have to remember a .filter(school=...);
+#  - new rows get that school (SchoolField);
+#  - cache keys are prefixed with the school's slug (make_key).
+# Management commands run without a school and see everything.
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import UserManager
+from django.db import models
+from django.http import Http404
+from django.urls import get_script_prefix, set_script_prefix
+
+
+PATH_PREFIX = re.compile(r"^/s/(?P<slug>[-a-z0-9]+)(?P<rest>/.*)?$")
+SCHOOL_SECONDS = 60
+
+_current = ContextVar("school", default=None)
+_default = {}  # slug -> id of the default school, it never moves
+_schools = {}  # slug -> (School, monotonic time it goes stale)
+
+
+def current_school():
+    return _current.get()
+
+
+def current_school_id():
+    """The request's school, or the default school outside a request."""
+    school = _current.get()
+    if school is not None:
+        return school.id
+
+    slug = settings.DEFAULT_SCHOOL_SLUG
+    if slug not in _default:
+        from .models import School
+
+        _default[slug] = School.objects.values_list("id", flat=True).get(slug=slug)
+    return _default[slug]
+
+
+@contextmanager
+def use_school(school):
+    """Scope queries and cache keys to `school` (None: no school, see everything)."""
+    token = _current.set(school)
+    try:
+        yield school
+    finally:
+        _current.reset(token)
+
+
+class SchoolField(models.ForeignKey):
+    """Foreign key to School that fills itself in on insert (save() and bulk_create()) if left empty."""
+
+    def pre_save(self, model_instance, add):
+        if add and getattr(model_instance, self.attname) is None:
+            setattr(model_instance, self.attname, current_school_id())
+        return super().pre_save(model_instance, add)
+
+
+class TenantManager(models.Manager):
+    """Default manager that only returns the current school's rows.
+
+    `field` is the path to the school, for models that reach it through a parent.
+    """
+
+    def __init__(self, field="school"):
+        super().__init__()
+        self.field = field
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        school = _current.get()
+        # related managers (classroom.assignments, ...) start from a row that
+        # was already scoped, another join would buy nothing
+        if school is None or getattr(self, "instance", None) is not None:
+            return queryset
+        return queryset.filter(**{f"{self.field}_id": school.id})
+
+
+class TenantUserManager(TenantManager, UserManager):
+    pass
+
+
+# Schools by slug. This runs on every request, so the rows are kept in the
+# process for SCHOOL_SECONDS (not in the shared cache, where they would
+# drown out the hit ratio on /metrics). Unknown slugs aren't remembered.
+
+def get_school(slug):
+    """School with this slug, or None."""
+    from .models import School
+
+    cached = _schools.get(slug)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
+    school = School.objects.filter(slug=slug).first()
+    if school is not None:
+        _schools[slug] = (school, time.monotonic() + SCHOOL_SECONDS)
+    return school
+
+
+def forget_schools():
+    # slugs can change too; other processes catch up within SCHOOL_SECONDS
+    _schools.clear()
+
+
+def make_key(key, key_prefix, version):
+    # CACHES KEY_FUNCTION: one namespace per school, so no cached page or
+    # count can leak into another school's requests
+    school = _current.get()
+    if school is None:
+        return f"{key_prefix}:{version}:{key}"
+    return f"{key_prefix}:{version}:{school.slug}:{key}"
+
+
+class TenantMiddleware:
+    # Goes before SessionMiddleware: the session's user is looked up through
+    # the scoped User manager, so a login only counts at its own school.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        prefix = get_script_prefix()
+        school, rest = self.resolve(request)
+        if school is None:
+            raise Http404("No such school.")
+
+        if rest is not None:
+            # /s/lincoln/class/3/ is routed as /class/3/, and reverse()
+            # puts the prefix back on every URL the views build
+            request.path_info = rest
+            set_script_prefix(f"{prefix}s/{school.slug}/")
+
+        request.school = school
+        token = _current.set(school)
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+            set_script_prefix(prefix)
+
+    def resolve(self, request):
+        """(school, path without the /s/<slug> prefix or None)."""
+        base = settings.SCHOOLHUB_BASE_DOMAIN
+        if base:
+            host = request.get_host().rsplit(":", 1)[0].lower()
+            if host.endswith("." + base):
+                return get_school(host[:-len(base) - 1]), None
+
+        match = PATH_PREFIX.match(request.path_info)
+        if match:
+            return get_school(match["slug"]), match["rest"] or "/"
+
+        return get_school(settings.DEFAULT_SCHOOL_SLUG), None
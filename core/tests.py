@@ -1,12 +1,37 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from urllib.parse import quote
+
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
+from django.utils.http import http_date
 from django.contrib.auth import get_user_model
 from datetime import timedelta
+from decimal import Decimal
 from django.utils import timezone
 
+from core import views
 from core.models import Enrollment
 from core.models import Classroom
 from core.models import Assignment
+from core.models import CalendarToken
+from core.models import ClassroomCalendar
+from core.models import Submission
+from core.models import ArchivedAssignment
+from core.models import AssignmentStats, EnrollmentStats, Grade
+from core.models import ActivityEvent
+from core.routers import PIN_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware
+from core.models import GRADIENT_PAIRS, gradient_class, gradient_css
 
 User = get_user_model()
 
@@ -240,4 +265,1263 @@ def test_past_assignment_moves_to_past_tab(self):
 
     # optional but strong: ensure it does not show as active!
     active_section = response.content.decode().split('id="active"')[1]
-    self.assertNotIn("Old Assignment", active_section)
\ No newline at end of file
+    self.assertNotIn("Old Assignment", active_section)
+
+class CalendarFeedTests(TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.student = User.objects.create_user(username="stud", password="pass", is_teacher=False)
+        self.classroom = Classroom.objects.create(name="Chemistry", teacher=self.teacher)
+        Enrollment.objects.create(student=self.student, classroom=self.classroom)
+        Assignment.objects.create(
+            classroom=self.classroom,
+            title="Lab report, part 1",
+            due_date=timezone.now().date() + timedelta(days=3)
+        )
+        self.token = CalendarToken.objects.create(user=self.student)
+
+    def test_feed_lists_assignments(self):
+        response = self.client.get(reverse("calendar_feed", args=[self.token.token]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        self.assertContains(response, "BEGIN:VCALENDAR")
+        self.assertContains(response, "SUMMARY:Lab report\\, part 1 (Chemistry)")
+
+    def test_conditional_get_returns_304(self):
+        url = reverse("class_calendar_feed", args=[self.token.token, self.classroom.id])
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_feed_rebuilt_when_assignment_changes(self):
+        url = reverse("calendar_feed", args=[self.token.token])
+        etag = self.client.get(url)["ETag"]
+
+        Assignment.objects.create(
+            classroom=self.classroom,
+            title="Quiz",
+            due_date=timezone.now().date() + timedelta(days=5)
+        )
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "SUMMARY:Quiz (Chemistry)")
+
+    def test_revoked_token_stops_working(self):
+        self.client.login(username="stud", password="pass")
+        self.client.post(reverse("calendar_settings"), {"revoke": "1"})
+
+        response = self.client.get(reverse("calendar_feed", args=[self.token.token]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_class_feed_requires_enrollment(self):
+        other = Classroom.objects.create(name="Art", teacher=self.teacher)
+        response = self.client.get(reverse("class_calendar_feed", args=[self.token.token, other.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.student = User.objects.create_user(username="stud", password="pass", is_teacher=False)
+        self.classroom = Classroom.objects.create(name="Physics", description="Forces and motion", teacher=self.teacher)
+        self.other = Classroom.objects.create(name="Other Physics", teacher=self.teacher)
+        Enrollment.objects.create(student=self.student, classroom=self.classroom)
+
+        self.assignment = Assignment.objects.create(
+            classroom=self.classroom,
+            title="Pendulum experiment",
+            description="Measure the period of oscillation"
+        )
+        Assignment.objects.create(classroom=self.other, title="Pendulum worksheet")
+
+    def test_finds_assignment_by_description(self):
+        self.client.login(username="stud", password="pass")
+        response = self.client.get(reverse("search"), {"q": "oscillations"})
+
+        self.assertContains(response, "Pendulum experiment")
+
+    def test_respects_enrollment(self):
+        self.client.login(username="stud", password="pass")
+        response = self.client.get(reverse("search"), {"q": "pendulum"})
+
+        self.assertContains(response, "Pendulum experiment")
+        self.assertNotContains(response, "Pendulum worksheet")
+
+    def test_index_follows_edits_and_deletes(self):
+        self.client.login(username="stud", password="pass")
+
+        self.assignment.title = "Spring constant lab"
+        self.assignment.save()
+        self.assertContains(self.client.get(reverse("search"), {"q": "spring"}), "Spring constant lab")
+
+        self.assignment.delete()
+        self.assertNotContains(self.client.get(reverse("search"), {"q": "spring"}), "Spring constant lab")
+
+    def test_query_syntax_is_not_passed_through(self):
+        self.client.login(username="teach", password="pass")
+        response = self.client.get(reverse("search"), {"q": 'physics" (*'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Other Physics")
+
+    def test_teacher_with_thousands_of_classes(self):
+        # more classes than SQLite will take bound parameters in one statement
+        Classroom.objects.bulk_create(
+            Classroom(name=f"Section {i}", code=f"S{i:07}", teacher=self.teacher) for i in range(1200)
+        )
+        last = Classroom.objects.filter(teacher=self.teacher).latest("id")
+        Assignment.objects.create(classroom=last, title="Pendulum retake")
+        self.client.login(username="teach", password="pass")
+
+        # session, user, one search however many classes, the assignments
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("search"), {"q": "pendulum"})
+
+        self.assertContains(response, "Pendulum retake")
+        self.assertContains(response, "Pendulum worksheet")
+
+
+class StaticAssetTests(TestCase):
+
+    def test_layout_has_no_external_assets(self):
+        response = self.client.get(reverse("index"))
+
+        self.assertNotContains(response, "cdn.jsdelivr.net")
+        self.assertContains(response, "/static/vendor/bootstrap/bootstrap.min.css")
+
+    def test_page_weight_reports_dashboard_cost(self):
+        out = StringIO()
+        call_command("page_weight", "--classes", "3", "--max-requests", "5", stdout=out)
+
+        self.assertIn("requests: 5", out.getvalue())
+        self.assertFalse(User.objects.filter(username="__page_weight__").exists())
+
+
+class BannerStyleTests(TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.client.login(username="teach", password="pass")
+
+    def test_generated_css_is_up_to_date(self):
+        # run `python manage.py build_gradient_css` if this fails
+        path = Path(__file__).resolve().parent / "static" / "gradients.css"
+        self.assertEqual(path.read_text(), gradient_css())
+
+    def test_dashboard_uses_gradient_class(self):
+        classroom = Classroom.objects.create(name="Math", teacher=self.teacher)
+        response = self.client.get(reverse("dashboard"))
+
+        self.assertIn((classroom.gradient_start, classroom.gradient_end), GRADIENT_PAIRS)
+        self.assertContains(response, gradient_class(classroom.gradient_start, classroom.gradient_end))
+        self.assertNotContains(response, "linear-gradient")
+
+    def test_card_markup_stays_small(self):
+        Classroom.objects.create(name="Class 0", teacher=self.teacher)
+        one = len(self.client.get(reverse("dashboard")).content)
+
+        for i in range(1, 11):
+            Classroom.objects.create(name=f"Class {i}", teacher=self.teacher)
+        eleven = len(self.client.get(reverse("dashboard")).content)
+
+        self.assertLess((eleven - one) / 10, 800)
+
+
+def make_png(color="red"):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.classroom = Classroom.objects.create(name="Art", teacher=self.teacher)
+        self.client.login(username="teach", password="pass")
+
+    def upload(self, classroom, data):
+        self.client.post(reverse("class_appearance", args=[classroom.id]), {
+            "banner_image": SimpleUploadedFile("My Banner.PNG", data, content_type="image/png"),
+        })
+        classroom.refresh_from_db()
+        return classroom.banner_image
+
+    def test_banner_names_are_content_addressed(self):
+        banner = self.upload(self.classroom, make_png())
+
+        self.assertRegex(banner.name, r"^class_banners/[0-9a-f]{32}\.png$")
+
+        response = self.client.get(banner.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(b"".join(response.streaming_content), make_png())
+
+    def test_conditional_and_range_requests(self):
+        banner = self.upload(self.classroom, make_png())
+        etag = self.client.get(banner.url)["ETag"]
+
+        self.assertEqual(self.client.get(banner.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.get(banner.url, HTTP_RANGE="bytes=0-7")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 0-7/{len(make_png())}")
+        self.assertEqual(b"".join(response.streaming_content), make_png()[:8])
+
+        response = self.client.get(banner.url, HTTP_RANGE="bytes=99999-")
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(MEDIA_SERVE_MODE="x-accel-redirect")
+    def test_x_accel_redirect_offload(self):
+        banner = self.upload(self.classroom, make_png())
+        response = self.client.get(banner.url)
+
+        self.assertEqual(response["X-Accel-Redirect"], "/_protected/media/" + banner.name)
+        self.assertEqual(response.content, b"")
+
+    def legacy_banner(self, name):
+        # uploaded before banners were content-addressed
+        path = Path(self.media_root, "class_banners", name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(make_png())
+        os.utime(path, (1700000000.75, 1700000000.75))
+        return "/media/class_banners/" + quote(name)
+
+    def test_if_modified_since_alone(self):
+        url = self.legacy_banner("old.png")
+        last_modified = self.client.get(url)["Last-Modified"]
+
+        self.assertEqual(last_modified, http_date(1700000000))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    @override_settings(MEDIA_SERVE_MODE="x-accel-redirect")
+    def test_x_accel_redirect_quotes_the_name(self):
+        response = self.client.get(self.legacy_banner("Spring fête.png"))
+
+        self.assertEqual(response["X-Accel-Redirect"], "/_protected/media/class_banners/Spring%20f%C3%AAte.png")
+
+    def test_shared_banner_survives_removal(self):
+        other = Classroom.objects.create(name="Design", teacher=self.teacher)
+        first = self.upload(self.classroom, make_png())
+        second = self.upload(other, make_png())
+        self.assertEqual(first.name, second.name)
+
+        self.client.post(reverse("class_appearance", args=[self.classroom.id]), {"remove_banner": "1"})
+
+        self.assertEqual(self.client.get(second.url).status_code, 200)
+
+    def test_path_traversal_is_refused(self):
+        response = self.client.get("/media/../schoolhub/settings.py")
+        self.assertEqual(response.status_code, 404)
+
+
+class SubmissionTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.override = override_settings(SUBMISSIONS_ROOT=self.root, SUBMISSION_CHUNK_SIZE=8)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.student = User.objects.create_user(username="stud", password="pass")
+        self.outsider = User.objects.create_user(username="other", password="pass")
+        self.classroom = Classroom.objects.create(name="Film", teacher=self.teacher)
+        Enrollment.objects.create(student=self.student, classroom=self.classroom)
+        self.assignment = Assignment.objects.create(classroom=self.classroom, title="Short film", max_upload_mb=1)
+
+    def test_form_upload(self):
+        self.client.login(username="stud", password="pass")
+        response = self.client.post(reverse("submit_assignment", args=[self.assignment.id]), {
+            "file": SimpleUploadedFile("essay.pdf", b"%PDF-1.4 hello"),
+        })
+
+        self.assertEqual(response.status_code, 302)
+        submission = Submission.objects.get(student=self.student)
+        self.assertEqual(submission.original_name, "essay.pdf")
+        self.assertTrue(Path(self.root, submission.file.name).is_file())
+
+    def test_form_upload_over_quota_is_refused_early(self):
+        self.client.login(username="stud", password="pass")
+        response = self.client.post(reverse("submit_assignment", args=[self.assignment.id]), {
+            "file": SimpleUploadedFile("movie.mp4", b"x" * (2 * 1024 * 1024)),
+        })
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Submission.objects.exists())
+
+    def test_chunked_upload_resumes_and_completes(self):
+        self.client.login(username="stud", password="pass")
+        data = b"0123456789abcdefXYZ"
+
+        start = self.client.post(reverse("start_submission_upload", args=[self.assignment.id]), {
+            "filename": "clip.mov", "size": len(data),
+        })
+        self.assertEqual(start.status_code, 201)
+        url = reverse("submission_upload", args=[start.json()["id"]])
+
+        def send(offset, chunk):
+            return self.client.patch(url, chunk, content_type="application/octet-stream",
+                                     headers={"Upload-Offset": str(offset)})
+
+        self.assertEqual(send(0, data[:8]).json()["offset"], 8)
+
+        # a retry of an old chunk gets told where to continue
+        stale = send(0, data[:8])
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale.json()["offset"], 8)
+
+        self.assertEqual(self.client.get(url).json(), {"offset": 8, "size": len(data)})
+        self.assertEqual(send(8, data[8:16]).json()["complete"], False)
+        self.assertEqual(send(16, data[16:]).json()["complete"], True)
+
+        submission = Submission.objects.get(student=self.student)
+        self.assertEqual(Path(self.root, submission.file.name).read_bytes(), data)
+
+    def test_form_upload_needs_a_csrf_token(self):
+        from django.test import Client
+
+        client = Client(enforce_csrf_checks=True)
+        client.login(username="stud", password="pass")
+        url = reverse("submit_assignment", args=[self.assignment.id])
+
+        response = client.post(url, {"file": SimpleUploadedFile("essay.pdf", b"%PDF-1.4 hello")})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Submission.objects.exists())
+
+        client.get(reverse("assignment_detail", args=[self.assignment.id]))
+        response = client.post(url, {
+            "csrfmiddlewaretoken": client.cookies["csrftoken"].value,
+            "file": SimpleUploadedFile("essay.pdf", b"%PDF-1.4 hello"),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Submission.objects.exists())
+
+    def test_chunks_dont_need_a_csrf_token(self):
+        from django.test import Client
+
+        from core import submissions
+
+        client = Client(enforce_csrf_checks=True)
+        client.login(username="stud", password="pass")
+        upload = submissions.start_upload(self.assignment, self.student, "clip.mov", 4)
+
+        response = client.patch(reverse("submission_upload", args=[upload.id]), b"abcd",
+                                content_type="application/octet-stream", headers={"Upload-Offset": "0"})
+        self.assertEqual(response.json()["complete"], True)
+
+    def test_concurrent_chunks_for_the_same_offset(self):
+        from core import submissions
+        from core.models import SubmissionUpload
+
+        upload = submissions.start_upload(self.assignment, self.student, "clip.mov", 12)
+        # two requests that both loaded the upload before either wrote
+        first, second = SubmissionUpload.objects.get(pk=upload.pk), SubmissionUpload.objects.get(pk=upload.pk)
+
+        submissions.append_chunk(first, 0, BytesIO(b"AAAAAAAA"), 8)
+        with self.assertRaises(submissions.OffsetMismatch):
+            submissions.append_chunk(second, 0, BytesIO(b"BBBBBBBB"), 8)
+
+        self.assertEqual(second.received, 8)
+        self.assertEqual(upload.partial_path.read_bytes(), b"AAAAAAAA")
+        self.assertIsNotNone(submissions.append_chunk(second, 8, BytesIO(b"CCCC"), 4))
+
+    def test_chunked_upload_checks_quota_up_front(self):
+        self.client.login(username="stud", password="pass")
+        response = self.client.post(reverse("start_submission_upload", args=[self.assignment.id]), {
+            "filename": "huge.mov", "size": 5 * 1024 * 1024,
+        })
+        self.assertEqual(response.status_code, 413)
+
+    def test_teacher_list_and_download_permissions(self):
+        self.client.login(username="stud", password="pass")
+        self.client.post(reverse("submit_assignment", args=[self.assignment.id]), {
+            "file": SimpleUploadedFile("essay.pdf", b"%PDF-1.4 hello"),
+        })
+        submission = Submission.objects.get()
+        download = reverse("download_submission", args=[submission.id])
+
+        self.client.login(username="teach", password="pass")
+        listing = self.client.get(reverse("assignment_submissions", args=[self.assignment.id]))
+        self.assertContains(listing, "essay.pdf")
+        response = self.client.get(download)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("attachment", response["Content-Disposition"])
+
+        self.client.login(username="other", password="pass")
+        self.assertEqual(self.client.get(download).status_code, 403)
+        self.assertEqual(self.client.get(reverse("assignment_submissions", args=[self.assignment.id])).status_code, 403)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.student = User.objects.create_user(username="stud", email="stud@example.com", password="pass")
+        self.classroom = Classroom.objects.create(name="Geography", teacher=self.teacher)
+        Enrollment.objects.create(student=self.student, classroom=self.classroom)
+        Assignment.objects.create(classroom=self.classroom, title="Map, rivers")
+
+    def test_roster_csv_streams(self):
+        self.client.login(username="teach", password="pass")
+        response = self.client.get(reverse("export_classroom", args=[self.classroom.id]), {"format": "roster"})
+
+        self.assertTrue(response.streaming)
+        body = b"".join(response.streaming_content).decode()
+        self.assertIn("stud@example.com", body)
+        self.assertTrue(body.startswith("classroom_id,classroom,username"))
+
+    def test_zip_contains_every_file(self):
+        self.client.login(username="teach", password="pass")
+        response = self.client.get(reverse("export_classroom", args=[self.classroom.id]))
+
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()),
+            ["assignments.csv", "classrooms.csv", "roster.csv"]
+        )
+        self.assertIn('"Map, rivers"', archive.read("assignments.csv").decode())
+
+    def test_only_the_teacher_can_export(self):
+        self.client.login(username="stud", password="pass")
+        response = self.client.get(reverse("export_classroom", args=[self.classroom.id]))
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get(reverse("export_school"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "school.zip")
+            call_command("export_classrooms", "--output", str(path), stderr=StringIO())
+
+            with zipfile.ZipFile(path) as archive:
+                self.assertIn("Geography", archive.read("classrooms.csv").decode())
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    # accepts `limit` messages, then the "server" goes away
+    limit = None
+
+    def send_messages(self, messages):
+        if self.limit is not None and len(mail.outbox) + len(messages) > self.limit:
+            raise ConnectionError("SMTP server went away")
+        return super().send_messages(messages)
+
+
+class ReminderTests(TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.student = User.objects.create_user(username="stud", email="stud@example.com", password="pass")
+        self.no_email = User.objects.create_user(username="quiet", password="pass")
+
+        today = timezone.now().date()
+        for name, title in (("Math", "Fractions"), ("Music", "Scales")):
+            classroom = Classroom.objects.create(name=name, teacher=self.teacher)
+            Enrollment.objects.create(student=self.student, classroom=classroom)
+            Enrollment.objects.create(student=self.no_email, classroom=classroom)
+            Assignment.objects.create(classroom=classroom, title=title, due_date=today + timedelta(days=1))
+
+        Assignment.objects.create(classroom=classroom, title="Far away", due_date=today + timedelta(days=30))
+
+    def test_one_digest_per_student(self):
+        call_command("send_reminders", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ["stud@example.com"])
+        self.assertEqual(message.subject, "2 assignments due soon")
+        self.assertIn("Fractions (Math), due tomorrow", message.body)
+        self.assertNotIn("Far away", message.body)
+
+    def test_rerun_does_not_send_twice(self):
+        call_command("send_reminders", stdout=StringIO())
+        call_command("send_reminders", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_new_assignment_gets_its_own_reminder(self):
+        call_command("send_reminders", stdout=StringIO())
+        Assignment.objects.create(
+            classroom=Classroom.objects.get(name="Math"),
+            title="Decimals",
+            due_date=timezone.now().date()
+        )
+        call_command("send_reminders", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].subject, "1 assignment due soon")
+
+    def test_failure_halfway_through_a_batch(self):
+        for i in range(4):
+            student = User.objects.create_user(username=f"extra{i}", email=f"extra{i}@example.com")
+            Enrollment.objects.create(student=student, classroom=Classroom.objects.get(name="Math"))
+
+        with override_settings(EMAIL_BACKEND="core.tests.FailingEmailBackend"):
+            FailingEmailBackend.limit = 2
+            self.addCleanup(setattr, FailingEmailBackend, "limit", None)
+            with self.assertRaises(ConnectionError):
+                call_command("send_reminders", stdout=StringIO())
+            self.assertEqual(len(mail.outbox), 2)
+
+            # only what was delivered is logged, the rerun sends the other three
+            FailingEmailBackend.limit = None
+            call_command("send_reminders", stdout=StringIO())
+
+        recipients = [message.to[0] for message in mail.outbox]
+        self.assertEqual(len(recipients), 5)
+        self.assertEqual(len(set(recipients)), 5)
+
+    def test_dry_run_sends_nothing(self):
+        out = StringIO()
+        call_command("send_reminders", "--dry-run", stdout=out)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertIn("Would send 1 digest(s) covering 2 reminder(s)", out.getvalue())
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(TestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+
+    def route(self, method, view, cookies=None):
+        # run the middleware around a fake view and report where reads would go
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            seen["before_write"] = self.router.db_for_read(Classroom)
+            if request.method == "POST":
+                self.router.db_for_write(Classroom)
+            seen["after_write"] = self.router.db_for_read(Classroom)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        request = getattr(RequestFactory(), method)("/")
+        request.COOKIES.update(cookies or {})
+        seen["response"] = middleware(request)
+        return seen
+
+    def test_read_only_views_read_from_replica(self):
+        seen = self.route("get", views.dashboard)
+        self.assertEqual(seen["before_write"], "replica")
+        self.assertNotIn(PIN_COOKIE, seen["response"].cookies)
+
+    def test_other_views_stay_on_primary(self):
+        seen = self.route("get", views.create_classroom)
+        self.assertIsNone(seen["before_write"])
+
+    def test_write_pins_rest_of_request_and_next_ones(self):
+        seen = self.route("post", views.dashboard)
+        self.assertIsNone(seen["after_write"])
+        self.assertIn(PIN_COOKIE, seen["response"].cookies)
+
+        # the redirect that follows carries the cookie and reads the primary
+        seen = self.route("get", views.class_detail, cookies={PIN_COOKIE: "1"})
+        self.assertIsNone(seen["before_write"])
+
+    def test_sessions_never_read_from_replica(self):
+        from django.contrib.sessions.models import Session
+
+        def get_response(request):
+            middleware.process_view(request, views.dashboard, (), {})
+            return HttpResponse(self.router.db_for_read(Session) or "default")
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        self.assertEqual(middleware(RequestFactory().get("/")).content, b"default")
+
+    def test_writes_always_go_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Classroom), "default")
+        self.assertFalse(self.router.allow_migrate("replica", "core"))
+
+    def test_join_sets_pin_cookie(self):
+        classroom = Classroom.objects.create(name="Math", teacher=self.teacher)
+        User.objects.create_user(username="stud", password="pass")
+        self.client.login(username="stud", password="pass")
+
+        response = self.client.post(reverse("join_classroom"), {"code": classroom.code})
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+
+class StartupReportTests(TestCase):
+
+    def test_reports_phases_and_packages(self):
+        out = StringIO()
+        call_command("startup_report", "--top", "3", stdout=out)
+        output = out.getvalue()
+
+        self.assertIn("django.setup()", output)
+        self.assertIn("URL conf (views)", output)
+        self.assertIn("django", output)
+        self.assertRegex(output, r"imports: [\d.]+ s across \d+ modules")
+
+    def test_gunicorn_config(self):
+        from django.conf import settings
+
+        config = {}
+        exec((Path(settings.BASE_DIR) / "gunicorn.conf.py").read_text(), config)
+        self.assertTrue(config["preload_app"])
+        self.assertGreaterEqual(config["workers"], 1)
+        self.assertLess(config["max_requests_jitter"], config["max_requests"])
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        from core import metrics
+
+        self.metrics = metrics
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        override = override_settings(METRICS_DIR=self.tmp, METRICS_TOKEN="secret")
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics._reset()
+        cache.clear()
+
+        self.admin = User.objects.create_user(username="admin", password="pass", is_staff=True)
+
+    def scrape(self):
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_reconnecting_counts_each_query_once(self):
+        from django.db import connections
+
+        # what happens after every request with CONN_MAX_AGE=0 (close() is
+        # a no-op on the in-memory test database, so connect directly)
+        connection = connections.create_connection("default")
+        self.addCleanup(connection.close)
+        for _ in range(5):
+            connection.connect()
+        self.assertEqual(connection.execute_wrappers.count(self.metrics.count_queries), 1)
+
+        key = ("schoolhub_db_queries_total", (("alias", "default"),))
+        before = self.metrics.collect()[0].get(key, 0)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertEqual(self.metrics.collect()[0][key], before + 1)
+
+    def test_requires_token_or_staff(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+
+        User.objects.create_user(username="teacher", password="pass", is_teacher=True)
+        self.client.login(username="teacher", password="pass")
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+        self.client.login(username="admin", password="pass")
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+    def test_requests_logins_and_queries(self):
+        self.client.post(reverse("login"), {"username": "admin", "password": "nope"})
+        self.client.post(reverse("login"), {"username": "admin", "password": "pass"})
+        self.client.get(reverse("dashboard"))
+
+        output = self.scrape()
+        self.assertIn('schoolhub_logins_total{result="failure"} 1', output)
+        self.assertIn('schoolhub_logins_total{result="success"} 1', output)
+        self.assertIn('schoolhub_http_requests_total{view="dashboard",status="200"} 1', output)
+        self.assertIn('schoolhub_http_request_duration_seconds_bucket{view="dashboard",le="+Inf"} 1', output)
+        self.assertIn('schoolhub_http_request_duration_seconds_count{view="login"} 2', output)
+        self.assertRegex(output, r'schoolhub_http_request_db_queries_total\{view="dashboard"\} \d+')
+        self.assertRegex(output, r'schoolhub_db_queries_total\{alias="default"\} \d+')
+
+    def test_business_gauges_and_cache(self):
+        teacher = User.objects.create_user(username="teacher", password="pass", is_teacher=True)
+        classroom = Classroom.objects.create(name="Math", teacher=teacher)
+        Enrollment.objects.create(student=User.objects.create_user(username="stud"), classroom=classroom)
+        Assignment.objects.create(classroom=classroom, title="HW", due_date=timezone.localdate())
+
+        output = self.scrape()
+        self.assertIn("schoolhub_classrooms 1", output)
+        self.assertIn("schoolhub_enrollments 1", output)
+        self.assertIn('schoolhub_users{role="teacher"} 1', output)
+        self.assertIn("schoolhub_assignments_due_today 1", output)
+
+        # second scrape reuses the cached gauges
+        self.assertIn('schoolhub_cache_requests_total{result="hit"} 1', self.scrape())
+
+    def test_merges_worker_files(self):
+        import json
+
+        # another worker's file counts whatever its pid means here (reused, another container, gone)
+        worker = {"counters": [["schoolhub_logins_total", [["result", "success"]], 5]], "histograms": []}
+        Path(self.tmp, "999999999-bbbb.json").write_text(json.dumps(worker))
+
+        self.assertIn('schoolhub_logins_total{result="success"} 5', self.scrape())
+        self.assertIn('schoolhub_logins_total{result="success"} 5', self.scrape())
+        self.assertTrue(Path(self.tmp, "999999999-bbbb.json").exists())
+
+    def test_exiting_worker_folds_into_the_archive(self):
+        self.addCleanup(self.metrics._reset)
+        self.metrics.inc("schoolhub_logins_total", (("result", "success"),), 3)
+        self.metrics.flush()
+
+        self.metrics.retire()
+        self.metrics.flush()  # too late, nothing gets written back
+        self.assertEqual([path.name for path in Path(self.tmp).glob("*.json")], ["archive.json"])
+
+        counters, _ = self.metrics.collect()
+        self.assertEqual(counters[("schoolhub_logins_total", (("result", "success"),))], 3)
+
+    def test_requests_dont_touch_the_files_between_flushes(self):
+        with override_settings(METRICS_FLUSH_SECONDS=3600):
+            for _ in range(5):
+                self.client.get(reverse("index"))
+        self.assertEqual(list(Path(self.tmp).iterdir()), [])
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.override = override_settings(SUBMISSIONS_ROOT=self.root)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.student = User.objects.create_user(username="stud", password="pass")
+        self.classroom = Classroom.objects.create(name="History", teacher=self.teacher)
+        Enrollment.objects.create(student=self.student, classroom=self.classroom)
+
+        today = timezone.localdate()
+        self.old = Assignment.objects.create(
+            classroom=self.classroom, title="Roman roads essay", due_date=today - timedelta(days=400)
+        )
+        self.recent = Assignment.objects.create(
+            classroom=self.classroom, title="Recent essay", due_date=today - timedelta(days=3)
+        )
+        self.submission = Submission.objects.create(
+            assignment=self.old, student=self.student, original_name="roads.txt", size=5,
+            file=SimpleUploadedFile("roads.txt", b"roads"),
+        )
+
+    def test_archive_moves_old_assignments_and_submissions(self):
+        out = StringIO()
+        call_command("archive", stdout=out)
+        self.assertIn("Archived 1 assignment(s)", out.getvalue())
+
+        self.assertFalse(Assignment.objects.filter(id=self.old.id).exists())
+        self.assertTrue(Assignment.objects.filter(id=self.recent.id).exists())
+
+        archived = ArchivedAssignment.objects.get(id=self.old.id)
+        self.assertEqual(archived.title, "Roman roads essay")
+        self.assertEqual(archived.created_at, self.old.created_at)
+        submission = archived.submissions.get()
+        self.assertEqual(submission.id, self.submission.id)
+        self.assertTrue(Path(self.root, submission.file.name).is_file())
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command("archive", "--dry-run", stdout=out)
+        self.assertIn("Would archive 1 assignment(s)", out.getvalue())
+        self.assertTrue(Assignment.objects.filter(id=self.old.id).exists())
+
+    def test_classroom_option_archives_everything_past(self):
+        call_command("archive", "--classroom", str(self.classroom.id), stdout=StringIO())
+        self.assertEqual(ArchivedAssignment.objects.count(), 2)
+
+    def test_past_tab_and_old_links_reach_archive(self):
+        call_command("archive", stdout=StringIO())
+        self.client.login(username="stud", password="pass")
+
+        response = self.client.get(reverse("class_detail", args=[self.classroom.id]))
+        self.assertNotContains(response, "Roman roads essay")
+        self.assertContains(response, "Show archived assignments")
+
+        response = self.client.get(reverse("class_detail", args=[self.classroom.id]), {"archived": "1"})
+        self.assertContains(response, "Roman roads essay")
+
+        response = self.client.get(reverse("assignment_detail", args=[self.old.id]))
+        self.assertRedirects(response, reverse("archived_assignment_detail", args=[self.old.id]))
+
+        response = self.client.get(reverse("archived_assignment_detail", args=[self.old.id]))
+        self.assertContains(response, "roads.txt")
+        response = self.client.get(reverse("download_archived_submission", args=[self.submission.id]))
+        self.assertEqual(b"".join(response.streaming_content), b"roads")
+
+    def test_search_finds_archived_only_when_asked(self):
+        call_command("archive", stdout=StringIO())
+        self.client.login(username="stud", password="pass")
+
+        response = self.client.get(reverse("search"), {"q": "roman"})
+        self.assertNotContains(response, "Roman roads essay")
+
+        response = self.client.get(reverse("search"), {"q": "roman", "archived": "1"})
+        self.assertContains(response, "Roman roads essay")
+        self.assertContains(response, reverse("archived_assignment_detail", args=[self.old.id]))
+
+    def test_batch_cost_doesnt_grow_with_its_size(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core import archive, ical, search
+
+        def archive_old():
+            ical.get_calendars([self.classroom])
+            with CaptureQueriesContext(connection) as queries:
+                archive.archive(timezone.localdate() - timedelta(days=365))
+            return len(queries)
+
+        one = archive_old()
+
+        due = timezone.localdate() - timedelta(days=400)
+        more = [Assignment.objects.create(classroom=self.classroom, title=f"Essay {i}", due_date=due) for i in range(10)]
+        Submission.objects.create(
+            assignment=more[0], student=self.student, original_name="a.txt", size=1,
+            file=SimpleUploadedFile("a.txt", b"a"),
+        )
+        self.assertEqual(archive_old(), one)
+
+        self.assertFalse(ClassroomCalendar.objects.exists())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {search.FTS_TABLE} WHERE rowid % {search.KIND_SLOTS} = {search.KIND_ASSIGNMENT}"
+            )
+            self.assertEqual(cursor.fetchone()[0], 1)  # self.recent
+
+    def test_restore(self):
+        call_command("archive", stdout=StringIO())
+        call_command("archive", "--restore", str(self.old.id), stdout=StringIO())
+
+        assignment = Assignment.objects.get(id=self.old.id)
+        self.assertEqual(assignment.created_at, self.old.created_at)
+        self.assertEqual(assignment.submissions.get().submitted_at, self.submission.submitted_at)
+        self.assertFalse(ArchivedAssignment.objects.exists())
+
+
+class RosterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        cls.classroom = Classroom.objects.create(name="Lecture Hall", teacher=cls.teacher)
+        students = User.objects.bulk_create(
+            User(username=f"student{i:04d}", email=f"s{i:04d}@school.test", password="!")
+            for i in range(2000)
+        )
+        Enrollment.objects.bulk_create(Enrollment(student=s, classroom=cls.classroom) for s in students)
+        User.objects.create_user(username="Zed", email="ZED.Parker@school.test", password="pass")
+        Enrollment.objects.create(student=User.objects.get(username="Zed"), classroom=cls.classroom)
+
+    def setUp(self):
+        self.client.login(username="teach", password="pass")
+
+    def test_page_has_fixed_query_and_memory_budget(self):
+        import tracemalloc
+
+        url = reverse("classroom_roster", args=[self.classroom.id])
+        self.client.get(url)  # warm template caches
+
+        tracemalloc.start()
+        # session, user, classroom, one page of enrollments
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.assertContains(response, "student0000")
+        self.assertNotContains(response, "student0050")
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+    def test_keyset_pages_cover_everyone_once(self):
+        url = reverse("classroom_roster_api", args=[self.classroom.id])
+        seen, after = [], None
+        while True:
+            params = {"limit": 200}
+            if after:
+                params["after"] = after
+            data = self.client.get(url, params).json()
+            seen += [s["username"] for s in data["students"]]
+            after = data["next"]
+            if after is None:
+                break
+
+        self.assertEqual(len(seen), 2001)
+        self.assertEqual(len(set(seen)), 2001)
+        self.assertEqual(seen, sorted(seen))
+
+    def test_prefix_search_on_username_or_email(self):
+        url = reverse("classroom_roster_api", args=[self.classroom.id])
+
+        data = self.client.get(url, {"q": "STUDENT199"}).json()
+        self.assertEqual([s["username"] for s in data["students"]], [f"student{i}" for i in range(1990, 2000)])
+
+        data = self.client.get(url, {"q": "zed.p"}).json()
+        self.assertEqual([s["username"] for s in data["students"]], ["Zed"])
+
+        # prefix, not substring
+        self.assertEqual(self.client.get(url, {"q": "tudent"}).json()["students"], [])
+
+    def test_teacher_only(self):
+        self.client.login(username="Zed", password="pass")
+        self.assertEqual(self.client.get(reverse("classroom_roster", args=[self.classroom.id])).status_code, 403)
+        self.assertEqual(self.client.get(reverse("classroom_roster_api", args=[self.classroom.id])).status_code, 403)
+
+
+class GradebookTests(TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.classroom = Classroom.objects.create(name="Algebra", teacher=self.teacher)
+        self.assignment = Assignment.objects.create(
+            classroom=self.classroom, title="Quiz 1", due_date=timezone.localdate() - timedelta(days=500)
+        )
+        self.enrollments = []
+        for name in ("ann", "bob", "cat"):
+            student = User.objects.create_user(username=name, password="pass")
+            self.enrollments.append(Enrollment.objects.create(student=student, classroom=self.classroom))
+
+    def grade(self, *scores):
+        from decimal import Decimal
+        from core import grades
+
+        grades.set_grades(self.assignment, {
+            e.id: None if s is None else Decimal(s) for e, s in zip(self.enrollments, scores)
+        })
+
+    def test_summaries_follow_writes(self):
+        self.grade(50, 70, 100)
+        stats = AssignmentStats.objects.get(assignment=self.assignment)
+        self.assertEqual(stats.count, 3)
+        self.assertAlmostEqual(stats.mean, 220 / 3)
+        self.assertEqual(stats.median, 70)
+        self.assertEqual(stats.histogram, [0, 0, 0, 0, 0, 1, 0, 1, 0, 1])
+
+        self.grade(90, None)
+        stats.refresh_from_db()
+        self.assertEqual((stats.count, stats.mean, stats.median), (2, 95, 95))
+        self.assertEqual(EnrollmentStats.objects.get(enrollment=self.enrollments[1]).count, 0)
+        self.assertEqual(EnrollmentStats.objects.get(enrollment=self.enrollments[0]).average, 90)
+
+    def test_grading_form(self):
+        self.client.login(username="teach", password="pass")
+        url = reverse("grade_assignment", args=[self.assignment.id])
+        first, second = self.enrollments[0].id, self.enrollments[1].id
+
+        response = self.client.post(url, {f"score-{first}": "101"})
+        self.assertContains(response, "Scores must be numbers from 0 to 100")
+        self.assertFalse(Grade.objects.exists())
+
+        response = self.client.post(url, {f"score-{first}": "88.5", f"score-{second}": ""})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Grade.objects.get().score, Decimal("88.50"))
+        self.assertEqual(AssignmentStats.objects.get(assignment=self.assignment).mean, 88.5)
+
+        response = self.client.get(reverse("gradebook", args=[self.classroom.id]))
+        self.assertContains(response, "88.5")
+
+    def test_student_sees_own_scores(self):
+        self.grade(40, 80)
+        self.client.login(username="ann", password="pass")
+        response = self.client.get(reverse("gradebook", args=[self.classroom.id]))
+        self.assertContains(response, "Your average: 40.0")
+        self.assertEqual(self.client.get(reverse("grade_assignment", args=[self.assignment.id])).status_code, 403)
+
+    def test_leaving_class_updates_assignment_stats(self):
+        self.grade(40, 80)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.enrollments[0].delete()
+        self.assertEqual(AssignmentStats.objects.get(assignment=self.assignment).mean, 80)
+
+    def test_check_grade_stats_finds_and_fixes_stale_rows(self):
+        from django.core.management.base import CommandError
+
+        self.grade(40, 80)
+        call_command("check_grade_stats", stdout=StringIO())
+
+        # behind the gradebook's back: the grades go, the summaries stay
+        Enrollment.objects.filter(id=self.enrollments[0].id).delete()
+        with self.assertRaisesMessage(CommandError, "1 assignment(s) and 0 enrollment(s)"):
+            call_command("check_grade_stats", stdout=StringIO())
+
+        call_command("check_grade_stats", "--fix", stdout=StringIO())
+        self.assertEqual(AssignmentStats.objects.get(assignment=self.assignment).mean, 80)
+        call_command("check_grade_stats", stdout=StringIO())
+
+    def test_deleting_a_student_updates_assignment_stats(self):
+        self.grade(40, 80)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.enrollments[1].student.delete()
+        self.assertEqual(AssignmentStats.objects.get(assignment=self.assignment).mean, 40)
+
+    def test_deleting_a_class_doesnt_visit_each_enrollment(self):
+        from django.db.models.signals import post_delete, pre_delete
+
+        self.grade(40, 80)
+        self.assertFalse(pre_delete.has_listeners(Enrollment) or post_delete.has_listeners(Enrollment))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classroom.delete()
+        self.assertFalse(Grade.objects.exists() or AssignmentStats.objects.exists())
+
+    def test_archive_keeps_grades(self):
+        self.grade(40, 80)
+        call_command("archive", stdout=StringIO())
+
+        self.assertEqual(ArchivedAssignment.objects.get().grades.count(), 2)
+        self.assertEqual(EnrollmentStats.objects.get(enrollment=self.enrollments[0]).count, 0)
+
+        call_command("archive", "--restore", str(self.assignment.id), stdout=StringIO())
+        self.assertEqual(AssignmentStats.objects.get(assignment=self.assignment).mean, 60)
+        self.assertEqual(EnrollmentStats.objects.get(enrollment=self.enrollments[0]).average, 40)
+
+
+class LargeGradebookTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        from core import grades
+
+        cls.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        cls.classroom = Classroom.objects.create(name="Lecture", teacher=cls.teacher)
+        students = User.objects.bulk_create(User(username=f"s{i:03d}", password="!") for i in range(200))
+        enrollments = Enrollment.objects.bulk_create(Enrollment(student=s, classroom=cls.classroom) for s in students)
+        assignments = Assignment.objects.bulk_create(
+            Assignment(classroom=cls.classroom, title=f"Homework {i}") for i in range(100)
+        )
+        for i, assignment in enumerate(assignments):
+            grades.set_grades(assignment, {e.id: Decimal((i + j) % 101) for j, e in enumerate(enrollments)})
+
+    def test_renders_from_summaries_only(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.assertEqual(Grade.objects.count(), 20000)
+        self.client.login(username="teach", password="pass")
+        url = reverse("gradebook", args=[self.classroom.id])
+        self.client.get(url)  # the school is looked up once per process
+
+        # session, user, classroom, assignments + stats, a page of students, their stats
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(queries), 6)
+        self.assertFalse(any('"core_grade"' in q["sql"] for q in queries))
+        self.assertContains(response, "Homework 99")
+
+
+class ActivityLogTests(TestCase):
+
+    def setUp(self):
+        from core import activity
+
+        self.activity = activity
+        activity._reset()
+        self.addCleanup(activity._reset)
+
+        self.admin = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.student = User.objects.create_user(username="stud", password="pass")
+        self.classroom = Classroom.objects.create(name="Chemistry", teacher=self.teacher)
+
+    def test_events_are_buffered_then_written_in_one_insert(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.login(username="stud", password="pass")
+        self.client.post(reverse("join_classroom"), {"code": self.classroom.code})
+        self.assertFalse(ActivityEvent.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.activity.flush(), 2)
+        self.assertEqual(len(queries), 1)
+
+        actions = set(ActivityEvent.objects.values_list("action", "classroom_id"))
+        self.assertEqual(actions, {(ActivityEvent.LOGIN, None), (ActivityEvent.JOINED, self.classroom.id)})
+
+    @override_settings(ACTIVITY_BUFFER_SIZE=3)
+    def test_flushes_on_size(self):
+        for _ in range(2):
+            self.activity.record(ActivityEvent.LOGIN, user=self.student)
+        self.assertFalse(ActivityEvent.objects.exists())
+        self.activity.record(ActivityEvent.LOGIN, user=self.student)
+        self.assertEqual(ActivityEvent.objects.count(), 3)
+
+    @override_settings(ACTIVITY_FLUSH_SECONDS=0)
+    def test_flushes_on_time_after_request(self):
+        self.client.post(reverse("login"), {"username": "stud", "password": "wrong"})
+        event = ActivityEvent.objects.get()
+        self.assertEqual((event.action, event.detail), (ActivityEvent.LOGIN_FAILED, "stud"))
+
+    def test_teacher_actions(self):
+        self.client.login(username="teach", password="pass")
+        self.client.post(reverse("create_assignment", args=[self.classroom.id]), {"title": "Titration"})
+        self.client.post(reverse("class_appearance", args=[self.classroom.id]), {"regen_gradient": "1"})
+        self.activity.flush()
+
+        details = list(
+            ActivityEvent.objects.filter(classroom=self.classroom).order_by("id").values_list("action", "detail")
+        )
+        self.assertEqual(details, [
+            (ActivityEvent.ASSIGNMENT_CREATED, "Titration"),
+            (ActivityEvent.APPEARANCE_CHANGED, "new gradient"),
+        ])
+
+    def test_query_view(self):
+        self.activity.record(ActivityEvent.JOINED, user=self.student, classroom=self.classroom)
+        self.activity.record(ActivityEvent.LOGIN, user=self.teacher)
+
+        self.client.login(username="teach", password="pass")
+        self.assertEqual(self.client.get(reverse("activity_log")).status_code, 403)
+
+        self.client.login(username="admin", password="pass")
+        response = self.client.get(reverse("activity_log"), {"user": "stud"})
+        self.assertContains(response, "Joined a class")
+        self.assertNotContains(response, "teach")
+
+        response = self.client.get(reverse("activity_log"), {"classroom": self.classroom.id})
+        self.assertContains(response, "Chemistry")
+        self.assertNotContains(response, "Logged in")
+
+    def test_events_keep_the_school_they_were_recorded_at(self):
+        from core.models import School
+        from core.tenancy import use_school
+
+        lincoln = School.objects.create(name="Lincoln High", slug="lincoln")
+        with use_school(lincoln):
+            self.activity.record(ActivityEvent.LOGIN, user=self.student)
+        self.activity.record(ActivityEvent.LOGIN, user=self.teacher)
+        self.activity.flush()  # outside any school
+
+        self.assertEqual(
+            set(ActivityEvent.objects.values_list("user_id", "school__slug")),
+            {(self.student.id, "lincoln"), (self.teacher.id, "default")},
+        )
+
+    def test_prune(self):
+        ActivityEvent.objects.create(action=ActivityEvent.LOGIN, created_at=timezone.now() - timedelta(days=400))
+        ActivityEvent.objects.create(action=ActivityEvent.LOGIN)
+
+        out = StringIO()
+        call_command("prune_activity", "--days", "180", stdout=out)
+        self.assertIn("Removed 1 activity event(s).", out.getvalue())
+        self.assertEqual(ActivityEvent.objects.count(), 1)
+
+
+class TenancyTests(TestCase):
+
+    def setUp(self):
+        from core.models import School
+
+        self.lincoln = School.objects.create(name="Lincoln High", slug="lincoln")
+        self.teacher = User.objects.create_user(username="teach", password="pass", is_teacher=True)
+        self.classroom = Classroom.objects.create(name="Home Ec", teacher=self.teacher)
+
+        self.other_teacher = User.objects.create_user(
+            username="lteach", password="pass", is_teacher=True, is_staff=True, school=self.lincoln
+        )
+        self.other_student = User.objects.create_user(
+            username="lstud", email="l@example.com", password="pass", school=self.lincoln
+        )
+        self.other_classroom = Classroom.objects.create(name="Robotics", teacher=self.other_teacher)
+
+    def test_rows_take_the_school_of_their_parent(self):
+        enrollment = Enrollment.objects.create(student=self.other_student, classroom=self.other_classroom)
+        assignment = Assignment.objects.create(classroom=self.other_classroom, title="Build a robot")
+
+        self.assertEqual(self.other_classroom.school, self.lincoln)
+        self.assertEqual(enrollment.school, self.lincoln)
+        self.assertEqual(assignment.school, self.lincoln)
+        self.assertEqual(self.classroom.school.slug, "default")
+
+    def test_path_prefix(self):
+        self.client.post("/s/lincoln/login/", {"username": "lteach", "password": "pass"})
+        response = self.client.get("/s/lincoln/dashboard/")
+
+        self.assertContains(response, "Robotics")
+        self.assertNotContains(response, "Home Ec")
+        # links keep the prefix
+        self.assertContains(response, f'href="/s/lincoln/class/{self.other_classroom.id}/"')
+
+    @override_settings(SCHOOLHUB_BASE_DOMAIN="schoolhub.test")
+    def test_subdomain(self):
+        self.client.login(username="lteach", password="pass")
+        response = self.client.get("/dashboard/", HTTP_HOST="lincoln.schoolhub.test")
+        self.assertContains(response, "Robotics")
+
+        self.assertEqual(self.client.get("/", HTTP_HOST="nowhere.schoolhub.test").status_code, 404)
+
+    def test_unknown_school(self):
+        self.assertEqual(self.client.get("/s/nowhere/").status_code, 404)
+
+    def test_other_schools_rows_dont_exist(self):
+        self.client.login(username="lteach", password="pass")
+        self.assertEqual(self.client.get(f"/s/lincoln/class/{self.classroom.id}/").status_code, 404)
+        self.assertEqual(self.client.get(f"/s/lincoln/class/{self.other_classroom.id}/").status_code, 200)
+
+    def test_logins_stay_at_their_school(self):
+        response = self.client.post("/s/lincoln/login/", {"username": "teach", "password": "pass"})
+        self.assertContains(response, "Invalid username and/or password.")
+
+        # a session from one school is nobody at another
+        self.client.login(username="teach", password="pass")
+        response = self.client.get("/s/lincoln/dashboard/")
+        self.assertRedirects(response, "/s/lincoln/login/?next=/s/lincoln/dashboard/", fetch_redirect_response=False)
+
+    def test_register_at_a_school(self):
+        self.client.post("/s/lincoln/register/", {
+            "username": "newbie", "email": "n@example.com", "password": "pass",
+            "confirmation": "pass", "role": "student",
+        })
+        self.assertEqual(User.objects.get(username="newbie").school, self.lincoln)
+
+    def test_class_codes_are_per_school(self):
+        Classroom.objects.filter(id=self.other_classroom.id).update(code=self.classroom.code)
+
+        self.client.login(username="lstud", password="pass")
+        response = self.client.post("/s/lincoln/class/join/", {"code": self.classroom.code})
+        self.assertRedirects(response, f"/s/lincoln/class/{self.other_classroom.id}/", fetch_redirect_response=False)
+        self.assertTrue(Enrollment.objects.filter(student=self.other_student, classroom=self.other_classroom).exists())
+
+    def test_cache_keys_per_school(self):
+        from core.tenancy import use_school
+
+        with use_school(self.lincoln):
+            cache.set("greeting", "lincoln")
+        self.addCleanup(cache.clear)
+
+        self.assertIsNone(cache.get("greeting"))
+        with use_school(self.lincoln):
+            self.assertEqual(cache.get("greeting"), "lincoln")
+
+    def test_exports_are_per_school(self):
+        Enrollment.objects.create(student=self.other_student, classroom=self.other_classroom)
+        Enrollment.objects.create(
+            student=User.objects.create_user(username="stud", email="d@example.com"), classroom=self.classroom
+        )
+
+        self.client.login(username="lteach", password="pass")
+        response = self.client.get("/s/lincoln/export/", {"format": "roster"})
+        body = b"".join(response.streaming_content).decode()
+
+        self.assertIn('filename="lincoln-', response["Content-Disposition"])
+        self.assertIn("l@example.com", body)
+        self.assertNotIn("d@example.com", body)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "classrooms.csv")
+            call_command("export_classrooms", "--school", "lincoln", "--format", "classrooms",
+                         "--output", str(path), stderr=StringIO())
+            body = path.read_text()
+        self.assertIn("Robotics", body)
+        self.assertNotIn("Home Ec", body)
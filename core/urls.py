@@ -14,6 +14,29 @@ urlpatterns = [
     path("class/<int:id>/", views.class_detail, name="class_detail"),
     path("class/<int:class_id>/assignments/new/", views.create_assignment, name="create_assignment"),
     path("class/<int:id>/appearance/", views.class_appearance, name="class_appearance"),
+    path("class/<int:id>/export/", views.export_classroom, name="export_classroom"),
+    path("class/<int:id>/roster/", views.classroom_roster, name="classroom_roster"),
+    path("class/<int:id>/roster.json", views.classroom_roster_api, name="classroom_roster_api"),
+    path("class/<int:id>/gradebook/", views.gradebook, name="gradebook"),
+    path("export/", views.export_school, name="export_school"),
 path("assignment/<int:assignment_id>/", views.assignment_detail, name="assignment_detail"),
+    path("assignment/<int:assignment_id>/submit/", views.submit_assignment, name="submit_assignment"),
+    path("assignment/<int:assignment_id>/uploads/", views.start_submission_upload, name="start_submission_upload"),
+    path("assignment/<int:assignment_id>/submissions/", views.assignment_submissions, name="assignment_submissions"),
+    path("assignment/<int:assignment_id>/grades/", views.grade_assignment, name="grade_assignment"),
+    path("uploads/<uuid:upload_id>/", views.submission_upload, name="submission_upload"),
+    path("submission/<int:submission_id>/download/", views.download_submission, name="download_submission"),
+
+    path("archive/assignment/<int:assignment_id>/", views.archived_assignment_detail, name="archived_assignment_detail"),
+    path("archive/submission/<int:submission_id>/download/", views.download_archived_submission, name="download_archived_submission"),
+
+    path("search/", views.search_view, name="search"),
+
+    path("metrics", views.metrics_view, name="metrics"),
+    path("activity/", views.activity_log, name="activity_log"),
+
+    path("calendar/", views.calendar_settings, name="calendar_settings"),
+    path("calendar/<str:token>.ics", views.calendar_feed, name="calendar_feed"),
+    path("calendar/<str:token>/class/<int:class_id>.ics", views.calendar_feed, name="class_calendar_feed"),
 
 ] 
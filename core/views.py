@@ -1,10 +1,19 @@
+import hmac
+
+from django.conf import settings
 from django.db import IntegrityError
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden #I need this right??
-from .models import User, Classroom, Enrollment, Assignment
+from django.core.paginator import Paginator
+from django.http import HttpResponse, HttpResponseForbidden, Http404, JsonResponse, StreamingHttpResponse #I need this right??
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from .models import ActivityEvent, User, Classroom, Enrollment, Assignment, ArchivedAssignment, ArchivedSubmission, CalendarToken, EnrollmentStats, Grade, Submission, SubmissionUpload
 from django.utils import timezone
+from . import activity, exports, grades, ical, metrics, roster, search, submissions
+from .media import send_file
+from .routers import replica_reads
 
 def index(request):
     return render(request, "index.html")
@@ -76,6 +85,7 @@ def logout_view(request):
     return redirect("index")
 
 
+@replica_reads
 @login_required
 def dashboard(request):
     user = request.user
@@ -108,6 +118,7 @@ def create_classroom(request):
             description=description,
             teacher=request.user
         )
+        activity.record(ActivityEvent.CLASS_CREATED, request, classroom=classroom)
 
         return redirect("class_detail", id=classroom.id)
 
@@ -141,6 +152,7 @@ def join_classroom(request):
             })
 
         Enrollment.objects.create(student=request.user, classroom=classroom)
+        activity.record(ActivityEvent.JOINED, request, classroom=classroom)
         return redirect("class_detail", id=classroom.id)
 
     return render(request, "join_class.html")
@@ -158,6 +170,7 @@ def create_assignment(request, class_id):
         title = request.POST.get("title")
         description = request.POST.get("description", "")
         due_date = request.POST.get("due_date")  # optional
+        max_upload_mb = request.POST.get("max_upload_mb") or 25
 
         if not title:
             return render(request, "create_assignment.html", {
@@ -165,12 +178,24 @@ def create_assignment(request, class_id):
                 "classroom": classroom
             })
 
+        try:
+            max_upload_mb = int(max_upload_mb)
+        except ValueError:
+            max_upload_mb = 0
+        if not 1 <= max_upload_mb <= settings.SUBMISSION_MAX_UPLOAD_MB:
+            return render(request, "create_assignment.html", {
+                "message": f"Upload limit must be between 1 and {settings.SUBMISSION_MAX_UPLOAD_MB} MB.",
+                "classroom": classroom
+            })
+
         assignment = Assignment.objects.create(
             classroom=classroom,
             title=title,
             description=description,
             due_date=due_date if due_date else None,
+            max_upload_mb=max_upload_mb,
         )
+        activity.record(ActivityEvent.ASSIGNMENT_CREATED, request, classroom=classroom, detail=assignment.title)
 
         return redirect("class_detail", id=classroom.id)
 
@@ -193,10 +218,14 @@ def class_appearance(request, id):
         # Remove banner → fall back to gradient
         if "remove_banner" in request.POST:
             if classroom.banner_image:
-                classroom.banner_image.delete(save=False)
+                # files are named by content, another class may be using the same one
+                shared = Classroom.all_objects.filter(banner_image=classroom.banner_image.name).exclude(id=classroom.id)
+                if not shared.exists():
+                    classroom.banner_image.delete(save=False)
                 classroom.banner_image = None
             classroom.save()
             message = "Banner removed. Using gradient instead."
+            activity.record(ActivityEvent.APPEARANCE_CHANGED, request, classroom=classroom, detail="banner removed")
 
         # Regenerate gradient (new random theme)
         elif "regen_gradient" in request.POST:
@@ -204,6 +233,7 @@ def class_appearance(request, id):
             classroom.gradient_end = ""
             classroom.save()
             message = "Gradient updated."
+            activity.record(ActivityEvent.APPEARANCE_CHANGED, request, classroom=classroom, detail="new gradient")
 
         # Upload / change banner image
         else:
@@ -212,6 +242,7 @@ def class_appearance(request, id):
                 classroom.banner_image = banner
                 classroom.save()
                 message = "Banner updated."
+                activity.record(ActivityEvent.APPEARANCE_CHANGED, request, classroom=classroom, detail="banner uploaded")
             else:
                 message = "Please choose an image before saving."
 
@@ -220,9 +251,15 @@ def class_appearance(request, id):
         "message": message,
     })
 
+@replica_reads
 @login_required
 def assignment_detail(request, assignment_id):
-    assignment = get_object_or_404(Assignment, id=assignment_id)
+    assignment = Assignment.objects.filter(id=assignment_id).first()
+    if assignment is None:
+        # old links keep working after `manage.py archive`
+        if ArchivedAssignment.objects.filter(id=assignment_id).exists():
+            return redirect("archived_assignment_detail", assignment_id)
+        raise Http404
 
     # Optional: permission check (recommended)
     if request.user.is_teacher:
@@ -235,11 +272,175 @@ def assignment_detail(request, assignment_id):
         ).exists():
             return HttpResponseForbidden("You are not enrolled in this class.")
 
-    return render(request, "inspect_assignment.html", {
-        "assignment": assignment
+    return render(request, "inspect_assignment.html", _assignment_context(request, assignment))
+
+
+def _assignment_context(request, assignment, message=None):
+    context = {"assignment": assignment, "message": message}
+    if not request.user.is_teacher:
+        context["my_submissions"] = assignment.submissions.filter(student=request.user).order_by("-submitted_at")
+        context["chunk_size"] = settings.SUBMISSION_CHUNK_SIZE
+    return context
+
+
+def _can_submit(user, assignment):
+    return not user.is_teacher and Enrollment.objects.filter(
+        student=user,
+        classroom_id=assignment.classroom_id
+    ).exists()
+
+
+def _submission_limit(assignment_id):
+    max_upload_mb = Assignment.objects.filter(id=assignment_id).values_list("max_upload_mb", flat=True).first()
+    return max_upload_mb * 1024 * 1024 if max_upload_mb is not None else None
+
+
+@submissions.upload_limit(_submission_limit)
+@login_required
+def submit_assignment(request, assignment_id):
+    assignment = get_object_or_404(Assignment, id=assignment_id)
+
+    if not _can_submit(request.user, assignment):
+        return HttpResponseForbidden("You are not enrolled in this class.")
+
+    if request.method != "POST":
+        return redirect("assignment_detail", assignment_id=assignment.id)
+
+    # the body was read (up to the limit) for the CSRF check already
+    uploaded = request.FILES.get("file")
+
+    if request.upload_quota.exceeded:
+        too_big = f"Files for this assignment can be at most {assignment.max_upload_mb} MB."
+        return render(request, "inspect_assignment.html",
+                      _assignment_context(request, assignment, too_big), status=413)
+
+    if not uploaded:
+        return render(request, "inspect_assignment.html",
+                      _assignment_context(request, assignment, "Please choose a file to submit."))
+
+    submissions.save_uploaded_file(assignment, request.user, uploaded)
+    return redirect("assignment_detail", assignment_id=assignment.id)
+
+
+@login_required
+@require_POST
+def start_submission_upload(request, assignment_id):
+    assignment = get_object_or_404(Assignment, id=assignment_id)
+
+    if not _can_submit(request.user, assignment):
+        return JsonResponse({"error": "You are not enrolled in this class."}, status=403)
+
+    try:
+        size = int(request.POST.get("size", ""))
+    except ValueError:
+        return JsonResponse({"error": "File size is required."}, status=400)
+
+    filename = request.POST.get("filename", "")
+    if size <= 0 or not filename:
+        return JsonResponse({"error": "File name and size are required."}, status=400)
+
+    try:
+        upload = submissions.start_upload(assignment, request.user, filename, size)
+    except submissions.QuotaExceeded:
+        return JsonResponse({
+            "error": f"Files for this assignment can be at most {assignment.max_upload_mb} MB."
+        }, status=413)
+
+    return JsonResponse({
+        "id": str(upload.id),
+        "offset": 0,
+        "chunk_size": settings.SUBMISSION_CHUNK_SIZE,
+    }, status=201)
+
+
+# The upload's id is an unguessable capability and a chunk only lands at the
+# offset the server expects, so the PATCHes don't need a CSRF token.
+@csrf_exempt
+@login_required
+def submission_upload(request, upload_id):
+    upload = get_object_or_404(SubmissionUpload, id=upload_id, student=request.user)
+
+    if request.method in ("GET", "HEAD"):
+        return JsonResponse({"offset": upload.received, "size": upload.size})
+
+    if request.method == "DELETE":
+        submissions.discard_upload(upload)
+        return HttpResponse(status=204)
+
+    if request.method != "PATCH":
+        return HttpResponse(status=405, headers={"Allow": "GET, HEAD, PATCH, DELETE"})
+
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return JsonResponse({"error": "Upload-Offset and Content-Length are required."}, status=400)
+
+    try:
+        # reads the request body as a stream, never request.body
+        submission = submissions.append_chunk(upload, offset, request, length)
+    except submissions.OffsetMismatch:
+        return JsonResponse({"error": "Wrong offset.", "offset": upload.received}, status=409)
+    except submissions.QuotaExceeded:
+        return JsonResponse({"error": "Chunk too large."}, status=413)
+
+    return JsonResponse({
+        "offset": upload.received,
+        "complete": submission is not None,
     })
 
 
+@login_required
+def assignment_submissions(request, assignment_id):
+    assignment = get_object_or_404(Assignment.objects.select_related("classroom"), id=assignment_id)
+
+    if not request.user.is_teacher or assignment.classroom.teacher_id != request.user.id:
+        return HttpResponseForbidden("You do not teach this class.")
+
+    rows = (
+        assignment.submissions
+        .select_related("student")
+        .only("id", "original_name", "size", "submitted_at", "student__username", "student__email")
+        .order_by("-submitted_at", "-id")
+    )
+    page = Paginator(rows, 50).get_page(request.GET.get("page"))
+
+    return render(request, "assignment_submissions.html", {
+        "assignment": assignment,
+        "page": page,
+    })
+
+
+@login_required
+def download_submission(request, submission_id):
+    submission = get_object_or_404(Submission.objects.select_related("assignment__classroom"), id=submission_id)
+    return _send_submission(request, submission)
+
+
+@login_required
+def download_archived_submission(request, submission_id):
+    submission = get_object_or_404(ArchivedSubmission.objects.select_related("assignment__classroom"), id=submission_id)
+    return _send_submission(request, submission)
+
+
+def _send_submission(request, submission):
+    is_owner = submission.student_id == request.user.id
+    is_teacher = submission.assignment.classroom.teacher_id == request.user.id
+    if not (is_owner or is_teacher):
+        return HttpResponseForbidden("You cannot see this submission.")
+
+    return send_file(
+        request,
+        settings.SUBMISSIONS_ROOT,
+        submission.file.name,
+        settings.SUBMISSIONS_ACCEL_REDIRECT_PREFIX,
+        as_attachment=True,
+        filename=submission.original_name,
+        private=True,
+    )
+
+
+@replica_reads
 @login_required
 def class_detail(request, id):
     classroom = get_object_or_404(Classroom, id=id)
@@ -262,9 +463,352 @@ def class_detail(request, id):
         due_date__lt=today
     )
 
+    # the archive is only read when someone asks for it
+    show_archived = request.GET.get("archived") == "1"
+    archived_assignments = None
+    if show_archived:
+        archived_assignments = (
+            classroom.archived_assignments
+            .only("id", "title", "due_date")
+            .order_by("-due_date", "-id")
+        )
+
     return render(request, "class_detail.html", {
     "classroom": classroom,
     "active_assignments": active_assignments.order_by("due_date", "id"),
     "past_assignments": past_assignments.order_by("-due_date"),
+    "show_archived": show_archived,
+    "archived_assignments": archived_assignments,
     "today": today,
-})
\ No newline at end of file
+})
+
+
+def _teacher_classroom(request, id):
+    classroom = get_object_or_404(Classroom.objects.only("id", "name", "teacher_id"), id=id)
+    if classroom.teacher_id != request.user.id:
+        return None
+    return classroom
+
+
+@replica_reads
+@login_required
+def classroom_roster(request, id):
+    classroom = _teacher_classroom(request, id)
+    if classroom is None:
+        return HttpResponseForbidden("Only the teacher for this class can see its roster.")
+
+    query = request.GET.get("q", "")
+    enrollments, next_cursor = roster.roster_page(classroom, query, request.GET.get("after"))
+
+    return render(request, "roster.html", {
+        "classroom": classroom,
+        "enrollments": enrollments,
+        "query": query,
+        "next_cursor": next_cursor,
+        "first_page": not request.GET.get("after"),
+    })
+
+
+@replica_reads
+@login_required
+def classroom_roster_api(request, id):
+    classroom = _teacher_classroom(request, id)
+    if classroom is None:
+        return JsonResponse({"error": "Only the teacher for this class can see its roster."}, status=403)
+
+    try:
+        limit = min(max(int(request.GET.get("limit", roster.PAGE_SIZE)), 1), roster.MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number."}, status=400)
+
+    enrollments, next_cursor = roster.roster_page(
+        classroom, request.GET.get("q", ""), request.GET.get("after"), limit
+    )
+    return JsonResponse({
+        "students": [roster.as_json(enrollment) for enrollment in enrollments],
+        "next": next_cursor,
+    })
+
+
+@replica_reads
+@login_required
+def gradebook(request, id):
+    classroom = get_object_or_404(Classroom, id=id)
+
+    enrollment = None
+    if request.user.is_teacher:
+        if classroom.teacher_id != request.user.id:
+            return HttpResponseForbidden("You do not teach this class.")
+    else:
+        enrollment = Enrollment.objects.filter(student=request.user, classroom=classroom).first()
+        if enrollment is None:
+            return HttpResponseForbidden("You are not enrolled in this class.")
+
+    # summary rows only, the grades themselves are never read here
+    assignments = list(
+        classroom.assignments
+        .select_related("stats")
+        .only("id", "classroom", "title", "due_date", *(f"stats__{f}" for f in ("count", "mean", "median", "histogram")))
+        .order_by("due_date", "id")
+    )
+    for assignment in assignments:
+        assignment.summary = getattr(assignment, "stats", None)
+
+    if enrollment is None:
+        query = request.GET.get("q", "")
+        enrollments, next_cursor = roster.roster_page(classroom, query, request.GET.get("after"))
+        stats = EnrollmentStats.objects.in_bulk([row.id for row in enrollments])
+        for row in enrollments:
+            row.summary = stats.get(row.id)
+
+        return render(request, "gradebook.html", {
+            "classroom": classroom,
+            "assignments": assignments,
+            "class_average": grades.class_average([a.summary for a in assignments if a.summary]),
+            "enrollments": enrollments,
+            "query": query,
+            "next_cursor": next_cursor,
+            "first_page": not request.GET.get("after"),
+        })
+
+    # the student's own row: at most one grade per assignment
+    mine = dict(enrollment.grades.values_list("assignment_id", "score"))
+    for assignment in assignments:
+        assignment.my_score = mine.get(assignment.id)
+
+    return render(request, "gradebook.html", {
+        "classroom": classroom,
+        "assignments": assignments,
+        "my_stats": EnrollmentStats.objects.filter(enrollment=enrollment).first(),
+    })
+
+
+@login_required
+def grade_assignment(request, assignment_id):
+    assignment = get_object_or_404(Assignment.objects.select_related("classroom"), id=assignment_id)
+    if assignment.classroom.teacher_id != request.user.id:
+        return HttpResponseForbidden("Only the teacher for this class can grade it.")
+
+    query = request.GET.get("q", "")
+    enrollments, next_cursor = roster.roster_page(assignment.classroom, query, request.GET.get("after"))
+    message = None
+
+    if request.method == "POST":
+        scores = {}
+        for enrollment in enrollments:
+            key = f"score-{enrollment.id}"
+            if key not in request.POST:
+                continue
+            try:
+                scores[enrollment.id] = grades.parse_score(request.POST[key])
+            except grades.InvalidScore:
+                message = f"Scores must be numbers from 0 to 100 ({enrollment.student.username})."
+                break
+
+        if message is None:
+            grades.set_grades(assignment, scores)
+            return redirect(request.get_full_path())
+
+    current = dict(
+        Grade.objects
+        .filter(assignment=assignment, enrollment_id__in=[enrollment.id for enrollment in enrollments])
+        .values_list("enrollment_id", "score")
+    )
+    for enrollment in enrollments:
+        enrollment.score = request.POST.get(f"score-{enrollment.id}") if message else current.get(enrollment.id)
+
+    return render(request, "grade_assignment.html", {
+        "assignment": assignment,
+        "enrollments": enrollments,
+        "query": query,
+        "next_cursor": next_cursor,
+        "first_page": not request.GET.get("after"),
+        "message": message,
+    })
+
+
+@login_required
+def archived_assignment_detail(request, assignment_id):
+    assignment = get_object_or_404(ArchivedAssignment.objects.select_related("classroom"), id=assignment_id)
+
+    if request.user.is_teacher:
+        if assignment.classroom.teacher_id != request.user.id:
+            return HttpResponseForbidden("You do not have access to this assignment.")
+        submissions = assignment.submissions.select_related("student").order_by("-submitted_at", "-id")
+    else:
+        if not Enrollment.objects.filter(student=request.user, classroom_id=assignment.classroom_id).exists():
+            return HttpResponseForbidden("You are not enrolled in this class.")
+        submissions = assignment.submissions.filter(student=request.user).order_by("-submitted_at")
+
+    return render(request, "archived_assignment.html", {
+        "assignment": assignment,
+        "submissions": submissions,
+    })
+
+
+@login_required
+def calendar_settings(request):
+    if request.method == "POST":
+        # Revoking kills the old URLs right away; "reset" also hands out a new one
+        CalendarToken.objects.filter(user=request.user).delete()
+        if "revoke" not in request.POST:
+            CalendarToken.objects.create(user=request.user)
+        return redirect("calendar_settings")
+
+    token = CalendarToken.objects.filter(user=request.user).first()
+
+    return render(request, "calendar.html", {
+        "token": token,
+        "classes": ical.classrooms_for(request.user) if token else [],
+    })
+
+
+def _feed_calendars(request, token, class_id=None):
+    # condition() calls this for the etag and again for the body, so remember it
+    if not hasattr(request, "_feed_calendars"):
+        feed_token = CalendarToken.objects.select_related("user").filter(token=token).first()
+        if feed_token is None:
+            raise Http404("Unknown calendar feed.")
+
+        classes = ical.classrooms_for(feed_token.user)
+        if class_id is not None:
+            classes = classes.filter(id=class_id)
+            if not classes:
+                raise Http404("Unknown calendar feed.")
+            name = classes[0].name
+        else:
+            name = "SchoolHub"
+
+        request._feed_calendars = (name, ical.get_calendars(classes))
+    return request._feed_calendars
+
+
+def _feed_etag(request, token, class_id=None):
+    return ical.feed_etag(_feed_calendars(request, token, class_id)[1])
+
+
+def _feed_last_modified(request, token, class_id=None):
+    return ical.feed_last_modified(_feed_calendars(request, token, class_id)[1])
+
+
+@condition(etag_func=_feed_etag, last_modified_func=_feed_last_modified)
+def calendar_feed(request, token, class_id=None):
+    name, calendars = _feed_calendars(request, token, class_id)
+    response = HttpResponse(ical.render_feed(name, calendars), content_type="text/calendar; charset=utf-8")
+    response["Cache-Control"] = "private, max-age=300"
+    return response
+
+
+@login_required
+def search_view(request):
+    query = request.GET.get("q", "")
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+
+    archived = request.GET.get("archived") == "1"
+    results, has_next = search.search(request.user, query, page, archived=archived)
+
+    return render(request, "search.html", {
+        "query": query,
+        "archived": archived,
+        "results": results,
+        "page": page,
+        "has_next": has_next,
+    })
+
+
+EXPORT_FORMATS = {
+    # ?format=  ->  (filename suffix, content type)
+    "zip": (".zip", "application/zip"),
+    "roster": ("-roster.csv", "text/csv; charset=utf-8"),
+    "assignments": ("-assignments.csv", "text/csv; charset=utf-8"),
+}
+
+
+def _export_response(classrooms, fmt, basename):
+    suffix, content_type = EXPORT_FORMATS[fmt]
+    if fmt == "zip":
+        content = exports.stream_zip(classrooms)
+    elif fmt == "roster":
+        content = exports.stream_csv(exports.roster_rows(classrooms))
+    else:
+        content = exports.stream_csv(exports.assignment_rows(classrooms))
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{basename}{suffix}"'
+    return response
+
+
+@login_required
+def export_classroom(request, id):
+    classroom = get_object_or_404(Classroom, id=id)
+
+    if not request.user.is_teacher or classroom.teacher != request.user:
+        return HttpResponseForbidden("Only the teacher for this class can export it.")
+
+    fmt = request.GET.get("format", "zip")
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponse("Unknown export format.", status=400)
+
+    return _export_response(
+        Classroom.objects.filter(id=classroom.id), fmt, f"{request.school.slug}-class-{classroom.code}"
+    )
+
+
+@login_required
+def export_school(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden("Only admins can export the whole school.")
+
+    fmt = request.GET.get("format", "zip")
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponse("Unknown export format.", status=400)
+
+    # The school filter goes into the queryset here. The rows themselves are
+    # only read while the response streams, after TenantMiddleware is done.
+    return _export_response(Classroom.objects.all(), fmt, f"{request.school.slug}-{timezone.now():%Y-%m-%d}")
+
+
+def metrics_view(request):
+    # Prometheus authenticates with the bearer token, people with a staff login
+    token = settings.METRICS_TOKEN
+    header = request.headers.get("Authorization", "")
+    scraper = bool(token) and hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+    if not scraper and not request.user.is_staff:
+        return HttpResponseForbidden("Metrics need a staff login or the metrics token.")
+
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@login_required
+def activity_log(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden("Only admins can see the activity log.")
+
+    # so what just happened in this process shows up too
+    activity.flush()
+
+    username = request.GET.get("user", "").strip()
+    classroom_id = request.GET.get("classroom", "").strip()
+    user_id = None
+    if username:
+        user_id = User.objects.filter(username=username).values_list("id", flat=True).first() or 0
+
+    try:
+        before = int(request.GET["before"]) if request.GET.get("before") else None
+        classroom_id = int(classroom_id) if classroom_id else None
+    except ValueError:
+        return HttpResponse("Bad filter.", status=400)
+
+    events, next_cursor = activity.events_for(user_id, classroom_id, before)
+
+    return render(request, "activity_log.html", {
+        "events": events,
+        "username": username,
+        "classroom_id": classroom_id or "",
+        "next_cursor": next_cursor,
+        "first_page": before is None,
+    })
@@ -0,0 +1,77 @@
+# Gunicorn settings. Picked up automatically when gunicorn is started from
+# the project root:
+#
+#     gunicorn schoolhub.wsgi
+#
+# Everything can be overridden from the environment (or on the command line).
+# Run `python manage.py startup_report` to see what a worker costs to boot.
+import gc
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+cpus = multiprocessing.cpu_count()
+
+wsgi_app = "schoolhub.wsgi:application"
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+# Import Django and the whole app once in the master, then fork. Workers
+# share those pages copy-on-write instead of each importing everything again.
+preload_app = True
+
+# The usual 2 * cores + 1, capped so a big box doesn't start more workers
+# than the database has connections for. WEB_CONCURRENCY wins if set.
+workers = env_int("WEB_CONCURRENCY", min(cpus * 2 + 1, env_int("GUNICORN_MAX_WORKERS", 8)))
+
+# Requests mostly wait on the database, so a couple of threads per worker
+# buys concurrency for much less memory than more processes.
+threads = env_int("GUNICORN_THREADS", 2)
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Recycle workers now and then so slow leaks don't build up; the jitter
+# keeps them from all restarting at the same moment.
+max_requests = env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = env_int("GUNICORN_MAX_REQUESTS_JITTER", 100)
+
+timeout = env_int("GUNICORN_TIMEOUT", 30)
+# On restart/deploy, in-flight requests get this long to finish.
+graceful_timeout = env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = env_int("GUNICORN_KEEPALIVE", 5)
+
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # Django imports the URL conf (and with it every view) on the first
+        # request; do it here so that happens once, not once per worker.
+        from django.urls import get_resolver
+
+        get_resolver().url_patterns
+
+    # Everything the master loaded is long-lived. Move it out of the
+    # collector's reach, or the first collection in each worker touches
+    # (and so copies) every one of those pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Never share a database connection opened in the master
+    from django.db import connections
+
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    # write out whatever the activity log still has buffered, and hand this
+    # worker's metrics over to the archive
+    from core import activity, metrics
+
+    activity.flush()
+    metrics.retire()
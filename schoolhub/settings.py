@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -28,10 +30,30 @@ DEBUG = True
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# How uploaded files reach the browser (see core/media.py):
+# "python" streams them from Django, "x-accel-redirect" (nginx) and
+# "x-sendfile" (Apache/lighttpd) let the front server send the bytes.
+MEDIA_SERVE_MODE = os.environ.get("MEDIA_SERVE_MODE", "python")
+# nginx "internal" location that aliases MEDIA_ROOT
+MEDIA_ACCEL_REDIRECT_PREFIX = "/_protected/media/"
+# Content-addressed uploads never change, everything else gets an hour
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MEDIA_MAX_AGE = 60 * 60
+
+# Student submissions are private, so they live outside MEDIA_ROOT
+SUBMISSIONS_ROOT = BASE_DIR / "submissions"
+SUBMISSIONS_ACCEL_REDIRECT_PREFIX = "/_protected/submissions/"
+# Resumable uploads arrive in pieces of at most this many bytes
+SUBMISSION_CHUNK_SIZE = 4 * 1024 * 1024
+# Upper bound a teacher can set per assignment
+SUBMISSION_MAX_UPLOAD_MB = 2048
+
 
 ALLOWED_HOSTS = ["*"]
 
 AUTH_USER_MODEL = "core.User"
+# a URL name rather than a path, so the redirect stays at the /s/<slug>/ school
+LOGIN_URL = "login"
 
 
 # Application definition
@@ -48,11 +70,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.metrics.MetricsMiddleware",
     'django.middleware.security.SecurityMiddleware',
+    'core.tenancy.TenantMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.submissions.UploadLimitMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,6 +113,32 @@ DATABASES = {
     }
 }
 
+# Read replicas (see core/routers.py). Read-only views spread their reads
+# over these, everything else stays on "default". To try it locally with a
+# second SQLite file standing in for a replica:
+#   cp db.sqlite3 db.replica.sqlite3
+#   SCHOOLHUB_REPLICA_DB=db.replica.sqlite3 python manage.py runserver
+DATABASE_ROUTERS = ["core.routers.ReplicaRouter"]
+DATABASE_REPLICAS = []
+
+if os.environ.get("SCHOOLHUB_REPLICA_DB"):
+    DATABASES["replica"] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / os.environ["SCHOOLHUB_REPLICA_DB"],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ["replica"]
+
+# How long a browser keeps reading from the primary after it wrote something
+REPLICA_PIN_SECONDS = 10
+
+
+# Email (deadline reminders). Console backend prints messages locally,
+# set EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend in production.
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
+EMAIL_FILE_PATH = BASE_DIR / "sent_emails"
+DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "SchoolHub <noreply@schoolhub.local>")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -125,6 +177,54 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# collectstatic writes content-hashed copies plus .gz/.br variants next to them,
+# WhiteNoise serves the hashed names with "Cache-Control: immutable".
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
+# Hashed files are cached forever anyway, this is for everything else
+WHITENOISE_MAX_AGE = 60 * 60
+
+# The cache backends in core.metrics count hits and misses for /metrics.
+# Keys get the current school's slug in them (core/tenancy.py).
+CACHES = {
+    "default": {"BACKEND": "core.metrics.LocMemCache"},
+}
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {"BACKEND": "core.metrics.RedisCache", "LOCATION": os.environ["REDIS_URL"]}
+CACHES["default"]["KEY_FUNCTION"] = "core.tenancy.make_key"
+
+# Schools (core/tenancy.py). With a base domain set, lincoln.<domain> is the
+# school with slug "lincoln"; /s/lincoln/... works either way. Requests that
+# name no school go to the default one.
+SCHOOLHUB_BASE_DOMAIN = os.environ.get("SCHOOLHUB_BASE_DOMAIN", "").lower()
+DEFAULT_SCHOOL_SLUG = "default"
+
+# Metrics (core/metrics.py). Every process writes its numbers to a file in
+# METRICS_DIR and /metrics adds them up, so all gunicorn workers of one
+# deployment must share it (and nothing else should).
+METRICS_DIR = os.environ.get(
+    "SCHOOLHUB_METRICS_DIR",
+    os.path.join(tempfile.gettempdir(), "schoolhub-metrics"),
+)
+METRICS_FLUSH_SECONDS = 5
+METRICS_GAUGE_SECONDS = 30
+# Prometheus sends "Authorization: Bearer <token>"; staff users can open /metrics too
+METRICS_TOKEN = os.environ.get("SCHOOLHUB_METRICS_TOKEN", "")
+
+# Activity log (core/activity.py): events are written in batches of this
+# many, or once the oldest has waited this long; prune_activity drops rows
+# older than the retention period.
+ACTIVITY_BUFFER_SIZE = 100
+ACTIVITY_FLUSH_SECONDS = 5
+ACTIVITY_RETENTION_DAYS = 180
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
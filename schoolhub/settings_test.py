@@ -0,0 +1,21 @@
+# Settings for the test suite:
+#
+#     python manage.py test --settings=schoolhub.settings_test
+#
+# Everything else is the same as schoolhub/settings.py.
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import STORAGES
+
+
+# collectstatic never runs before the tests, so there is no manifest to look
+# hashed names up in
+STORAGES = {
+    **STORAGES,
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# keep the test run's numbers out of a running dev server's /metrics
+METRICS_DIR = os.path.join(tempfile.gettempdir(), "schoolhub-metrics-test")